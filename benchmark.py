@@ -0,0 +1,374 @@
+''' PERFORMANCE BENCHMARKS
+Scripted scenarios timing asset loading, entity updates, the time from
+launch to the first frame and whole frames, rendered offscreen so no
+display (or GPU) is needed.
+
+python benchmark.py run --output baseline.json
+    ...make a change...
+python benchmark.py run --output current.json
+python benchmark.py compare baseline.json current.json
+'''
+
+from __future__ import annotations
+from typing import Any, Callable
+import os
+import sys
+#offscreen rendering, PyOpenGL has to be told before start.py loads it
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+import argparse
+import json
+import platform
+import re
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+
+#the game loads its assets relative to its own folder
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+import start
+from start import glGetString, glFinish, GL_RENDERER
+
+#frames rendered before timing starts, so loading and caches settle
+WARMUP = 3
+#a change in median time counts as a regression past this share...
+REGRESSION_THRESHOLD = 0.10
+#...and this many milliseconds, so tiny timings don't flag on noise
+REGRESSION_FLOOR_MS = 0.05
+
+ENTITY_COUNTS = (1_000, 10_000, 100_000)
+ARROW_COUNTS = (1, 100, 1_000, 10_000)
+LIGHT_COUNTS = (4, 64, 256)
+#fewer and smaller scenarios for a quick check
+QUICK_ENTITY_COUNTS = (1_000, 10_000)
+QUICK_ARROW_COUNTS = (1, 1_000)
+QUICK_LIGHT_COUNTS = (4, 256)
+#launches of the game timed to its first frame, they take a while each
+STARTUP_LAUNCHES = 5
+QUICK_STARTUP_LAUNCHES = 3
+
+############################## measuring ######################################
+
+def measure(run: Callable[[], Any], repeats: int, warmup: int = 1) -> dict[str, float]:
+    """
+        Time the given function.
+
+        It's run warmup times untimed, then repeats times timed, then
+        once more while tracing memory, for the peak bytes allocated
+        during a run (tracing slows it down, so that run isn't timed).
+
+        Returns:
+
+            min, median and p95 in milliseconds, the peak memory in
+            bytes and how many times it was timed.
+    """
+
+    for _ in range(warmup):
+        run()
+
+    times = []
+    for _ in range(repeats):
+        begin = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - begin) * 1000)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return summarize(times) | {"peak_bytes": int(peak)}
+
+def summarize(times: list[float]) -> dict[str, float]:
+    """ The min, median and p95 of some times in milliseconds, and how many there were. """
+
+    return {
+        "min_ms": float(np.min(times)),
+        "median_ms": float(np.median(times)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "repeats": len(times),
+    }
+
+############################## scenarios ######################################
+
+def benchmark_loading(repeats: int) -> dict[str, dict]:
+    """
+        Load every model in models/ with load_model_from_file, every
+        image in gfx/ as a Material2D and every cubemap as a
+        MaterialCubemap (textures through their caches, as the game does).
+    """
+
+    results = {}
+
+    for filename in sorted(os.listdir(start.MODEL_FOLDER)):
+        if filename.endswith(".obj"):
+            path = os.path.join(start.MODEL_FOLDER, filename)
+            results[f"load.model.{filename}"] = guard(
+                lambda: measure(lambda: start.load_model_from_file(path), repeats))
+
+    cubemaps = set()
+    for folder, _, filenames in sorted(os.walk("gfx")):
+        for filename in sorted(filenames):
+            path = os.path.join(folder, filename)
+            stem, extension = os.path.splitext(path)
+            if extension not in (".png", ".jpeg", ".jpg"):
+                continue
+            suffix = next(
+                (suffix for suffix in start.CUBEMAP_SUFFIXES if stem.endswith("_" + suffix)), None)
+            if suffix is not None:
+                cubemaps.add(stem[:-len(suffix) - 1])
+                continue
+            results[f"load.texture.{path}"] = guard(
+                lambda: measure(lambda: start.Material2D(path).destroy(), repeats))
+
+    for path in sorted(cubemaps):
+        results[f"load.cubemap.{path}"] = guard(
+            lambda: measure(lambda: start.MaterialCubemap(path).destroy(), repeats))
+
+    return results
+
+def benchmark_updates(counts: tuple[int, ...], repeats: int) -> dict[str, dict]:
+    """
+        Update a scene of many arrows, and bring all their transforms
+        up to date after they've all moved, one entity at a time with
+        get_model_transform and all at once through their store.
+    """
+
+    results = {}
+    for count in counts:
+        np.random.seed(0)
+        scene = start.Scene()
+        scene.renderables[start.OBJECT_PYRAMID] += make_arrows(
+            count - 1, scene.store(start.OBJECT_PYRAMID))
+        entities = scene.renderables[start.OBJECT_PYRAMID]
+        store = entities[0].store
+        #the biggest scenes take seconds a run, a few runs do
+        runs = max(3, repeats * 1_000 // count)
+
+        results[f"update.scene.{count}"] = measure(lambda: scene.update(1.0), runs)
+
+        def move_then_get_each():
+            store.positions[:len(store)] += 0.001
+            for entity in entities:
+                entity.get_model_transform()
+        results[f"update.transforms_each.{count}"] = measure(move_then_get_each, runs)
+
+        def move_then_update_store():
+            store.positions[:len(store)] += 0.001
+            store.update_transforms()
+        results[f"update.transforms_store.{count}"] = measure(move_then_update_store, runs)
+
+    return results
+
+def benchmark_rendering(engine: start.GraphicsEngine,
+    arrow_counts: tuple[int, ...], light_counts: tuple[int, ...],
+    repeats: int) -> dict[str, dict]:
+    """
+        Render whole frames (finished with glFinish) of a scene with
+        the given numbers of arrows and point lights in front of the
+        camera, every combination of the two.
+    """
+
+    results = {}
+    for arrows in arrow_counts:
+        for lights in light_counts:
+            np.random.seed(0)
+            scene = start.Scene()
+            scene.renderables[start.OBJECT_PYRAMID] += make_arrows(
+                arrows - 1, scene.store(start.OBJECT_PYRAMID))
+            scene.lights = make_lights(lights)
+            scene.camera.update()
+
+            def frame():
+                engine.render(scene.camera, scene.renderables, scene.lights, scene.index)
+                glFinish()
+            results[f"render.arrows_{arrows}.lights_{lights}"] = measure(
+                frame, repeats, warmup = WARMUP)
+
+    return results
+
+def benchmark_startup(launches: int) -> dict[str, dict]:
+    """
+        Launch the game headless for a single frame and time how long
+        it takes to get there, as the game reports it (which includes
+        its imports, but not starting Python itself). One launch goes
+        untimed first, so the shader and model caches are warm.
+    """
+
+    command = [sys.executable, "start.py", "--headless", "--frames", "1"]
+
+    def launch() -> float:
+        output = subprocess.run(
+            command, capture_output = True, text = True, check = True
+        ).stdout
+        found = re.search(r"first frame after ([\d.]+) ms", output)
+        if found is None:
+            raise RuntimeError(f"no time to first frame reported:\n{output}")
+        return float(found.group(1))
+
+    def time_launches() -> dict[str, float]:
+        launch()
+        return summarize([launch() for _ in range(launches)])
+
+    return {"startup.first_frame": guard(time_launches)}
+
+def make_arrows(count: int, store: start.TransformStore) -> list[start.Pyramid]:
+    """ Arrows scattered in front of the starting camera, kept in the given store. """
+
+    positions = np.random.uniform((-10, 0, -5), (10, 30, 5), (count, 3))
+    eulers = np.random.uniform(0, 360, (count, 3))
+    return [
+        start.Pyramid(position = position, eulers = euler, store = store)
+        for position, euler in zip(positions, eulers)
+    ]
+
+def make_lights(count: int) -> list[start.Light]:
+    """ Dim point lights scattered around the arrows. """
+
+    positions = np.random.uniform((-10, -2, -5), (10, 30, 5), (count, 3))
+    colors = np.random.uniform(0, 1, (count, 3))
+    return [
+        start.Light(position = position, color = color, strength = 0.5)
+        for position, color in zip(positions, colors)
+    ]
+
+def guard(benchmark: Callable[[], dict]) -> dict:
+    """ Run a benchmark, recording its error instead if it fails. """
+
+    try:
+        return benchmark()
+    except Exception as error:
+        return {"error": f"{type(error).__name__}: {error}"}
+
+############################## commands #######################################
+
+def run(arguments: argparse.Namespace) -> None:
+    """ Run every scenario (matching the filter) and save the results. """
+
+    width, height = (int(size) for size in arguments.size.lower().split("x"))
+    context = start.OffscreenContext(width, height)
+    engine = start.GraphicsEngine(width, height, None)
+    #assets are made on first use, the timings are of a game already running
+    engine.load_assets((start.OBJECT_PYRAMID, start.OBJECT_SKY))
+    engine.loader.finish()
+    renderer = glGetString(GL_RENDERER)
+
+    quick = arguments.quick
+    repeats = arguments.repeats or (5 if quick else 20)
+    suites = {
+        "load": lambda: benchmark_loading(repeats),
+        "update": lambda: benchmark_updates(
+            QUICK_ENTITY_COUNTS if quick else ENTITY_COUNTS, repeats),
+        "startup": lambda: benchmark_startup(
+            QUICK_STARTUP_LAUNCHES if quick else STARTUP_LAUNCHES),
+        "render": lambda: benchmark_rendering(
+            engine, QUICK_ARROW_COUNTS if quick else ARROW_COUNTS,
+            QUICK_LIGHT_COUNTS if quick else LIGHT_COUNTS, repeats),
+    }
+
+    results = {}
+    for name, suite in suites.items():
+        if arguments.filter and arguments.filter not in name:
+            continue
+        for scenario, result in suite().items():
+            results[scenario] = result
+            print_result(scenario, result)
+
+    engine.destroy()
+    context.destroy()
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "renderer": renderer.decode() if renderer else "",
+            "size": [width, height],
+            "quick": quick,
+        },
+        "results": results,
+    }
+    with open(arguments.output, "w") as f:
+        json.dump(report, f, indent = 2)
+    print(f"results written to {arguments.output}")
+
+def print_result(scenario: str, result: dict) -> None:
+
+    if "error" in result:
+        print(f"{scenario:<48}{result['error']}")
+        return
+    #memory isn't traced in other processes
+    memory = f"{result['peak_bytes'] / 2**20:>9.1f} MB" if "peak_bytes" in result else ""
+    print(f"{scenario:<48}{result['min_ms']:>10.3f}{result['median_ms']:>10.3f}"
+          f"{result['p95_ms']:>10.3f} ms{memory}")
+
+def compare(arguments: argparse.Namespace) -> int:
+    """
+        Compare the median times of two runs, flagging scenarios which
+        got slower than the threshold allows.
+
+        Returns:
+
+            The exit status, 1 if anything regressed.
+    """
+
+    with open(arguments.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(arguments.current) as f:
+        current = json.load(f)["results"]
+
+    regressions = 0
+    print(f"{'scenario':<48}{'baseline':>10}{'current':>10}{'change':>9}")
+    for scenario in sorted(baseline.keys() | current.keys()):
+        before, after = baseline.get(scenario, {}), current.get(scenario, {})
+        if "median_ms" not in before or "median_ms" not in after:
+            print(f"{scenario:<48}  only in one run, or failed")
+            continue
+
+        old, new = before["median_ms"], after["median_ms"]
+        change = (new - old) / old if old else 0.0
+        flag = ""
+        if change > arguments.threshold and new - old > REGRESSION_FLOOR_MS:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -arguments.threshold and old - new > REGRESSION_FLOOR_MS:
+            flag = "  faster"
+        print(f"{scenario:<48}{old:>10.3f}{new:>10.3f}{change:>+9.1%}{flag}")
+
+    print(f"{regressions} regression{'s' * (regressions != 1)} past {arguments.threshold:.0%}")
+    return 1 if regressions else 0
+
+def parse_arguments() -> argparse.Namespace:
+    """ Read the command line options. """
+
+    parser = argparse.ArgumentParser(description = "Yaka Arrow benchmarks")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    runner = commands.add_parser("run", help = "run the benchmarks and save the results")
+    runner.add_argument("--output", default = "benchmark.json",
+        help = "where to write the results (JSON)")
+    runner.add_argument("--quick", action = "store_true",
+        help = "fewer, smaller scenarios and repeats")
+    runner.add_argument("--repeats", type = int,
+        help = "timed runs of each scenario")
+    runner.add_argument("--filter",
+        help = "only run the suites (load, update, startup, render) whose name contains this")
+    runner.add_argument("--size", default = "800x600",
+        help = "the offscreen framebuffer size as WIDTHxHEIGHT")
+
+    comparer = commands.add_parser("compare", help = "compare results against a baseline")
+    comparer.add_argument("baseline", help = "results saved earlier")
+    comparer.add_argument("current", help = "results to check")
+    comparer.add_argument("--threshold", type = float, default = REGRESSION_THRESHOLD,
+        help = "slowdown (as a share of the baseline) which counts as a regression")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    if arguments.command == "run":
+        run(arguments)
+    else:
+        sys.exit(compare(arguments))
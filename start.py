@@ -4,21 +4,39 @@ pip install numpy
 pip install pyrr
 pip install pygame
 pip install pillow
-pip install scikit-learn
 pip install glfw
 '''
 
 from __future__ import annotations
-from typing import Any
-import glfw
-import glfw.GLFW as GLFW_CONSTANTS
+from typing import Any, Callable, Iterable, Iterator
+import os
+import sys
+import time
+#when starting up began, for the time to the first frame
+LAUNCH_TIME = time.perf_counter()
+#headless runs have no display, PyOpenGL has to be told before it loads
+if "--headless" in sys.argv or "--shader-report" in sys.argv:
+    os.environ.setdefault("PYOPENGL_PLATFORM", "osmesa" if "--osmesa" in sys.argv else "egl")
+    os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+else:
+    #only a window needs glfw, and loading it takes a while
+    import glfw
+    import glfw.GLFW as GLFW_CONSTANTS
 from OpenGL.GL import *
-from OpenGL.GL.shaders import compileProgram,compileShader
+from OpenGL.error import GLError
 import numpy as np
 import pyrr
 import ctypes
-from PIL import Image, ImageOps
-from sklearn.preprocessing import normalize
+import argparse
+import runpy
+import json
+from contextlib import contextmanager
+import struct
+import hashlib
+import queue
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+#PIL is imported where images are decoded, warm texture caches never need it
 
 
 ############################## Constants ######################################
@@ -36,15 +54,156 @@ RETURN_ACTION_EXIT = 1
 
 PIPELINE_SKY = 0
 PIPELINE_3D = 1
+#vertex and fragment shader of each pipeline
+SHADER_SOURCES = {
+    PIPELINE_SKY: ("shaders/vertex_sky.txt", "shaders/fragment_sky.txt"),
+    PIPELINE_3D: ("shaders/vertex.txt", "shaders/fragment.txt"),
+}
 
 #0: debug, 1: production
 GAME_MODE = 0
 
+#binary cache files written next to the assets they were built from
+CACHE_MAGIC = b"YAKA"
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct("<4sIq20s16sI")
+CACHE_SECTION = struct.Struct("<16s8sQQQ")
+CACHE_ALIGNMENT = 64
+
+MESH_CACHE_SUFFIX = ".meshcache"
+#x, y, z, s, t, nx, ny, nz vertices, drawn through uint32 indices,
+#in a range per material and level of detail (at most 16 bytes, as all layouts)
+MESH_LAYOUT = "p3t2n3/u32/m/lod"
+
+#triangles left in each simplified level of detail, as a share of the
+#full mesh, and the height on screen (in pixels) below which each is used
+LOD_RATIOS = (0.5, 0.25, 0.125)
+LOD_SCREEN_SIZES = (300, 150, 75)
+#how far past a screen size an entity must go before it changes level
+LOD_HYSTERESIS = 0.1
+#a collapse may turn a triangle by at most this much (cosine)
+LOD_MAX_TURN = 0.25
+#and move the surface by at most this share of the mesh's size,
+#doubled for each level as the screen sizes halve
+LOD_MAX_ERROR = 0.01
+
+#entries in the simulated post-transform vertex cache
+VERTEX_CACHE_SIZE = 16
+
+MODEL_FOLDER = "models"
+
+#obj text read per chunk, and vertex data sent per glBufferSubData, when streaming
+STREAM_CHUNK_SIZE = 1 << 20
+STREAM_UPLOAD_SIZE = 1 << 22
+
+#background asset loading
+ASSET_LOADER_WORKERS = 4
+#seconds per frame the render loop may spend uploading finished assets
+ASSET_UPLOAD_BUDGET = 0.004
+#shown in place of textures and models which are still loading
+PLACEHOLDER_COLOR = (128, 128, 128, 255)
+PLACEHOLDER_MODEL = "models/cube.obj"
+
+SKY_TEXTURE = "gfx/spacesky/sky"
+
+#entities the transform store of each object type starts with room for
+INSTANCE_CAPACITY = 1024
+
+#entities per leaf of the spatial index, and how much looser its boxes
+#may get from being refitted before it's rebuilt
+INDEX_LEAF_SIZE = 4
+INDEX_REBUILD_RATIO = 2.0
+#tint of the entity picked with the mouse
+SELECTED_TINT = (1.0, 0.5, 0.5, 1.0)
+
+#frames of timings kept by the profiler
+PROFILE_HISTORY = 600
+#seconds from launching to the first frame being shown which are acceptable
+FIRST_FRAME_BUDGET = 1.0
+
+#per frame data is written into a ring of this many buffers, so the cpu
+#can fill one while the gpu is still reading the ones before
+STREAM_SEGMENTS = 3
+#bytes each buffer of a ring starts with, they grow to fit
+STREAM_CAPACITY = 64 * 1024
+#offsets of writes into a ring are rounded up to this many bytes
+STREAM_ALIGNMENT = 16
+#how long (ns) each wait for the gpu to pass a fence lasts before trying again
+FENCE_TIMEOUT = 1_000_000
+#a transform then a tint per instance
+INSTANCE_FLOATS = 20
+
+#graphics memory meshes and textures may take up, in bytes, before
+#those drawn least recently are evicted (they reload when next drawn)
+GPU_MEMORY_BUDGET = 512 * 2**20
+
+#the simulation steps this many times a second, whatever the frame rate
+TICK_RATE = 60
+#longest frame caught up on, so one long stall doesn't take many ticks
+MAX_FRAME_TIME = 0.25
+#a capped frame sleeps until this close to its deadline, then naps
+SLEEP_MARGIN = 0.002
+
+#bit of each key in the input state, wasd first so they make the walking combo,
+#by glfw key name (GLFW_KEY_...) as glfw isn't loaded for headless runs
+KEY_BITS = {
+    "W": 1 << 0,
+    "A": 1 << 1,
+    "S": 1 << 2,
+    "D": 1 << 3,
+    "LEFT_SHIFT": 1 << 4,
+    "SPACE": 1 << 5,
+    "UP": 1 << 6,
+    "LEFT": 1 << 7,
+    "RIGHT": 1 << 8,
+}
+#degrees left of the way the camera faces that each combo of w (1),
+#a (2), s (4) and d (8) walks, nan stands still
+WALK_DIRECTIONS = np.array(
+    [np.nan, 0, 90, 45, 180, 0, 135, 90, 270, 315, 0, 0, 225, 270, 180, 0],
+    dtype=np.float32
+)
+#what's in an input recording: a header, then the keys held,
+#mouse movement and left click of every tick
+INPUT_MAGIC = b"YAKAINPUT"
+INPUT_RECORD = np.dtype([("keys", "<u2"), ("dx", "<f4"), ("dy", "<f4"), ("click", "u1")])
+
+#binding points of the std140 uniform blocks shared by every program
+UNIFORM_BINDING_CAMERA = 0
+#view, projection, then position, forwards, right, up padded to vec4s
+CAMERA_BLOCK_FLOATS = 48
+
+NEAR_PLANE = 0.1
+FAR_PLANE = 100
+
+#clustered lighting: the view frustum is cut into screen tiles across
+#and exponentially deeper slices away from the camera
+CLUSTER_GRID = (16, 9, 24)
+#a light reaches as far as its light falls to this strength
+LIGHT_CUTOFF = 0.01
+#texture units of the light data, cluster ranges and light index lists
+LIGHT_DATA_UNIT = 2
+CLUSTER_DATA_UNIT = 3
+LIGHT_INDEX_UNIT = 4
+
+TEXTURE_CACHE_SUFFIX = ".texcache"
+#(h, w * 4) RGBA rows per section, one section per mip level and face
+TEXTURE_LAYOUT = "rgba8"
+#filename endings of the six cubemap faces
+CUBEMAP_SUFFIXES = ("left", "right", "top", "bottom", "back", "front")
+
+#linked programs, as the driver's binary plus its format, and the
+#digest of the driver which made them, only that driver can load them
+PROGRAM_CACHE_SUFFIX = ".progcache"
+PROGRAM_LAYOUT = "glbinary"
+
 ############################## helper functions ###############################
 
 def createShader(vertexFilepath: str, fragmentFilepath: str) -> int:
     """
-        Compile and link a shader program from source.
+        Compile and link a shader program from source, or load the
+        program linked from the same source last time, by the same
+        driver, from its cache beside the vertex shader.
 
         Parameters:
 
@@ -57,126 +216,1808 @@ def createShader(vertexFilepath: str, fragmentFilepath: str) -> int:
             An integer, being a handle to the shader location on the graphics card
     """
 
-    with open(vertexFilepath,'r') as f:
-        vertex_src = f.readlines()
-
-    with open(fragmentFilepath,'r') as f:
-        fragment_src = f.readlines()
-    
-    shader = compileProgram(compileShader(vertex_src, GL_VERTEX_SHADER),
-                            compileShader(fragment_src, GL_FRAGMENT_SHADER),
-                            validate = False
-                        )
+    sources = [vertexFilepath, fragmentFilepath]
+    cache_path = f"{vertexFilepath}+{os.path.basename(fragmentFilepath)}{PROGRAM_CACHE_SUFFIX}"
+    driver = np.frombuffer(driver_key(), dtype=np.uint8)
+
+    format_count = int(glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS))
+    formats = np.zeros(format_count, dtype=np.int32)
+    if format_count:
+        glGetIntegerv(GL_PROGRAM_BINARY_FORMATS, formats)
+
+    sections = read_cache_file(cache_path, sources, PROGRAM_LAYOUT)
+    #a binary in a format the driver doesn't take is just dropped
+    if sections is not None and np.array_equal(sections["driver"], driver) \
+        and int(sections["format"][0]) in formats.tolist():
+        binary = np.ascontiguousarray(sections["binary"])
+        shader = glCreateProgram()
+        try:
+            glProgramBinary(shader, int(sections["format"][0]), binary, len(binary))
+            if glGetProgramiv(shader, GL_LINK_STATUS):
+                return shader
+        except GLError:
+            pass
+        #rejected, the driver may have been updated without its strings changing
+        glDeleteProgram(shader)
+
+    shader = link_program(sources)
+
+    if format_count > 0:
+        size = glGetProgramiv(shader, GL_PROGRAM_BINARY_LENGTH)
+        binary = np.zeros(size, dtype=np.uint8)
+        length = GLsizei()
+        binary_format = GLenum()
+        glGetProgramBinary(shader, size, ctypes.byref(length), ctypes.byref(binary_format), binary)
+        write_cache_file(cache_path, sources, PROGRAM_LAYOUT, {
+            "driver": driver,
+            "format": np.array([binary_format.value], dtype=np.uint32),
+            "binary": binary[:length.value],
+        })
     
     return shader
 
+def link_program(sources: list[str]) -> int:
+    """
+        Compile the vertex and fragment shader source files and link
+        them into a program which the driver is asked to keep a binary of.
+    """
+
+    #only needed when the program cache misses
+    from OpenGL.GL.shaders import compileShader
+
+    stages = []
+    for filename, stage in zip(sources, (GL_VERTEX_SHADER, GL_FRAGMENT_SHADER)):
+        with open(filename,'r') as f:
+            stages.append(compileShader(f.read(), stage))
+
+    shader = glCreateProgram()
+    for stage in stages:
+        glAttachShader(shader, stage)
+    glProgramParameteri(shader, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+    glLinkProgram(shader)
+    for stage in stages:
+        glDetachShader(shader, stage)
+        glDeleteShader(stage)
+
+    if not glGetProgramiv(shader, GL_LINK_STATUS):
+        log = glGetProgramInfoLog(shader)
+        glDeleteProgram(shader)
+        raise RuntimeError(f"linking {sources} failed: {log}")
+    return shader
+
+def driver_key() -> bytes:
+    """ Return a digest of the current context's vendor, renderer and version. """
+
+    digest = hashlib.sha1()
+    for name in (GL_VENDOR, GL_RENDERER, GL_VERSION):
+        digest.update((glGetString(name) or b"") + b"\n")
+    return digest.digest()
+
+def report_shader_load_times() -> None:
+    """
+        Print how long making every pipeline's program takes cold,
+        ie. compiled and linked from source, and warm, loaded from
+        the program cache. Needs a current context.
+    """
+
+    for vertexFilepath, fragmentFilepath in SHADER_SOURCES.values():
+        cache_path = f"{vertexFilepath}+{os.path.basename(fragmentFilepath)}{PROGRAM_CACHE_SUFFIX}"
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+    for label in ("cold", "warm"):
+        total = 0.0
+        for sources in SHADER_SOURCES.values():
+            start = time.perf_counter()
+            shader = createShader(*sources)
+            #wait for the driver to really finish with it
+            glGetProgramiv(shader, GL_LINK_STATUS)
+            elapsed = time.perf_counter() - start
+            total += elapsed
+            print(f"{sources[0]} + {sources[1]} {label}: {elapsed * 1000:.1f} ms")
+            glDeleteProgram(shader)
+        print(f"every program {label}: {total * 1000:.1f} ms")
+
+def create_model_transforms(
+    positions: np.ndarray, eulers: np.ndarray,
+    out: np.ndarray | None = None) -> np.ndarray:
+    """
+        Calculate the model transforms of many entities at once,
+        the same as Entity.get_model_transform does for one.
+
+        Parameters:
+
+            positions: (n, 3) positions
+
+            eulers: (n, 3) rotations in degrees, as roll, pitch, yaw
+
+            out: an (n, 4, 4) float32 array to write into, if given
+        
+        Returns:
+
+            The (n, 4, 4) float32 transforms.
+    """
+
+    if out is None:
+        out = np.empty((len(positions), 4, 4), dtype=np.float32)
+
+    radians = np.radians(np.asarray(eulers, dtype=np.float32))
+    sR, sP, sY = np.sin(radians).T
+    cR, cP, cY = np.cos(radians).T
+
+    #rotation, as pyrr.matrix44.create_from_eulers
+    out[:, 0, 0] = cY * cP
+    out[:, 0, 1] = -cY * sP * cR + sY * sR
+    out[:, 0, 2] = cY * sP * sR + sY * cR
+    out[:, 1, 0] = sP
+    out[:, 1, 1] = cP * cR
+    out[:, 1, 2] = -cP * sR
+    out[:, 2, 0] = -sY * cP
+    out[:, 2, 1] = sY * sP * cR + cY * sR
+    out[:, 2, 2] = -sY * sP * sR + cY * cR
+    out[:, 0:3, 3] = 0
+    #then translation, in the bottom row
+    out[:, 3, 0:3] = positions
+    out[:, 3, 3] = 1
+
+    return out
+
+def cluster_lights(
+    positions: np.ndarray, radii: np.ndarray,
+    view: np.ndarray, projection: np.ndarray,
+    grid: tuple[int, int, int] = CLUSTER_GRID,
+    near: float = NEAR_PLANE, far: float = FAR_PLANE) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Sort lights into the clusters of the view frustum they reach.
+
+        The frustum is cut into grid[0] x grid[1] tiles of the screen
+        and grid[2] slices of depth, spaced exponentially from near to
+        far. Each light is a sphere of its radius, it's put in every
+        cluster overlapped by the sphere's bounding box.
+
+        Parameters:
+
+            positions, radii: (n, 3) world positions and (n,) radii
+
+            view, projection: the camera's transforms, as pyrr makes them
+
+        Returns:
+
+            (clusters, 2) uint32 offset and count of each cluster's
+            lights in the list, and the uint32 list of light indices.
+    """
+
+    columns, rows, slices = grid
+    cluster_count = columns * rows * slices
+
+    #view space, the camera looks down -z
+    centers = np.c_[positions, np.ones(len(positions))] @ view
+    depth = -centers[:, 2]
+    depth_min = np.maximum(depth - radii, near)
+    depth_max = np.minimum(depth + radii, far)
+    #lights entirely behind or beyond the frustum reach nothing
+    reached = depth_min <= depth_max
+    depth_max = np.maximum(depth_max, near)
+
+    #depth slices covered
+    scale = slices / np.log(far / near)
+    first_slice = np.floor(np.log(depth_min / near) * scale).astype(np.int64)
+    last_slice = np.floor(np.log(depth_max / near) * scale).astype(np.int64)
+
+    #screen tiles covered, by the corners of the bounding box
+    def tile_range(center, focal, tiles):
+        low = np.minimum((center - radii) / depth_min, (center - radii) / depth_max)
+        high = np.maximum((center + radii) / depth_min, (center + radii) / depth_max)
+        return (
+            np.floor((focal * low + 1) / 2 * tiles).astype(np.int64),
+            np.floor((focal * high + 1) / 2 * tiles).astype(np.int64)
+        )
+    first_column, last_column = tile_range(centers[:, 0], projection[0, 0], columns)
+    first_row, last_row = tile_range(centers[:, 1], projection[1, 1], rows)
+
+    first = np.maximum(np.stack((first_column, first_row, first_slice), axis = 1), 0)
+    last = np.minimum(np.stack((last_column, last_row, last_slice), axis = 1), np.array(grid) - 1)
+    #as do lights off to the side
+    reached &= (first <= last).all(axis = 1)
+    extent = np.where(reached[:, None], last - first + 1, 0)
+
+    #every (light, cluster) pair, each light's box of clusters in turn
+    pairs_per_light = extent.prod(axis = 1)
+    light = np.repeat(np.arange(len(positions)), pairs_per_light)
+    local = np.arange(len(light)) - np.repeat(np.cumsum(pairs_per_light) - pairs_per_light, pairs_per_light)
+    width, height = extent[light, 0], extent[light, 1]
+    column = first[light, 0] + local % width
+    row = first[light, 1] + local // width % height
+    depth_slice = first[light, 2] + local // (width * height)
+    cluster = (depth_slice * rows + row) * columns + column
+
+    order = np.argsort(cluster, kind = "stable")
+    counts = np.bincount(cluster, minlength = cluster_count)
+    ranges = np.stack((np.cumsum(counts) - counts, counts), axis = 1).astype(np.uint32)
+    return ranges, light[order].astype(np.uint32)
+
+def frustum_planes(view: np.ndarray, projection: np.ndarray) -> np.ndarray:
+    """
+        Return the six planes of the camera's view frustum in world
+        space, as (6, 4) rows a, b, c, d with normals of unit length
+        pointing inwards, so a point is inside when ax + by + cz + d >= 0.
+    """
+
+    #pyrr's matrices take row vectors, clip = world @ view @ projection
+    clip = (view @ projection).T
+    planes = np.concatenate((clip[3] + clip[0:3], clip[3] - clip[0:3]))
+    return planes / np.linalg.norm(planes[:, 0:3], axis = 1, keepdims = True)
+
+def cull_instances(
+    planes: np.ndarray, transforms: np.ndarray, bounds: Bounds) -> np.ndarray:
+    """
+        Test every instance of a mesh against the frustum planes.
+
+        The bounding spheres are tested first, then the instances they
+        can't rule out are tested again with their bounding box, which
+        is turned along with the instance.
+
+        Parameters:
+
+            planes: (6, 4) frustum planes, see frustum_planes
+
+            transforms: (n, 4, 4) model transforms of the instances
+
+            bounds: the mesh's bounds, in model space
+
+        Returns:
+
+            A boolean mask of the instances at least partly inside.
+    """
+
+    normals, offsets = planes[:, 0:3], planes[:, 3]
+    axes = transforms[:, 0:3, 0:3]
+
+    #spheres, scaled by the largest scale of each instance
+    centers = bounds.center @ axes + transforms[:, 3, 0:3]
+    radii = bounds.radius * np.sqrt((axes * axes).sum(axis = 2).max(axis = 1))
+    visible = (centers @ normals.T + offsets >= -radii[:, None]).all(axis = 1)
+
+    #boxes, how far each reaches along each plane's normal
+    candidates = np.flatnonzero(visible)
+    box_centers = bounds.box_center @ axes[candidates] + transforms[candidates, 3, 0:3]
+    reach = np.abs(axes[candidates] @ normals.T).transpose(0, 2, 1) @ bounds.half_size
+    visible[candidates] = (box_centers @ normals.T + offsets >= -reach).all(axis = 1)
+
+    return visible
+
+def pick_lod_levels(
+    screen_sizes: np.ndarray, current: np.ndarray, level_count: int) -> np.ndarray:
+    """
+        Choose the level of detail of each entity from how tall it
+        is on screen (in pixels), see LOD_SCREEN_SIZES.
+
+        An entity only changes level once it's clearly past a screen
+        size (by LOD_HYSTERESIS), otherwise it keeps its current
+        level, so entities sitting right on a threshold don't flicker
+        between two levels.
+    """
+
+    thresholds = np.array(LOD_SCREEN_SIZES[:level_count - 1])
+    coarsest = (screen_sizes[:, None] < thresholds * (1 + LOD_HYSTERESIS)).sum(axis = 1)
+    finest = (screen_sizes[:, None] < thresholds * (1 - LOD_HYSTERESIS)).sum(axis = 1)
+    return np.clip(current, finest, coarsest)
+
+def box_distance(lower: np.ndarray, upper: np.ndarray, point: np.ndarray) -> np.ndarray:
+    """
+        Return how far the point is from each of the (n, 3) boxes
+        with the given corners, 0 for the boxes it's inside.
+    """
+
+    gap = np.maximum(np.maximum(lower - point, point - upper), 0)
+    return np.sqrt((gap * gap).sum(axis = 1))
+
 def load_model_from_file(
-    filename: str) -> list[float]:
-    """ 
-        Read the given obj file and return a list of all the
-        vertex data.
-    """
-
-    v = []
-    vt = []
-    vn = []
-    vertices = []
-
-    with open(filename,'r') as f:
-        line = f.readline()
-        while line:
-            words = line.split(" ")
-            if words[0] == "v":
-                v.append(read_vertex_data(words))
-            elif words[0] == "vt":
-                vt.append(read_texcoord_data(words))
-            elif words[0] == "vn":
-                vn.append(read_normal_data(words))
-            elif words[0] == "f":
-                read_face_data(words, v, vt, vn, vertices)
-            line = f.readline()
-    
-    return vertices
+    filename: str) -> np.ndarray:
+    """
+        Read the given obj file and return all of its vertex data,
+        interleaved as x, y, z, s, t, nx, ny, nz per triangle corner,
+        in a flat float32 array.
 
-def read_vertex_data(words: list[str]) -> list[float]:
-    """ 
-        read the given position description and
-        return the vertex it represents.
+        The file is parsed as one block of bytes with NumPy, so the
+        cost is a fixed number of array passes rather than a Python
+        call for every line and face corner.
     """
 
-    return [
-        float(words[1]),
-        float(words[2]),
-        float(words[3])
-    ]
+    with open(filename,'rb') as f:
+        data = f.read()
 
-def read_texcoord_data(words: list[str]) -> list[float]:
-    """ 
-        read the given texcoord description and
-        return the texcoord it represents.
+    vertices, _ = ObjReader().read_block(data)
+    return vertices.ravel()
+
+def stream_model_from_file(
+    filename: str, chunk_size: int = STREAM_CHUNK_SIZE,
+    reader: ObjReader | None = None) -> Iterator[tuple[np.ndarray, np.ndarray]]:
     """
+        Read the given obj file chunk_size bytes at a time, yielding
+        the (n, 8) triangle corners of the faces in each chunk and
+        the material of each triangle, see ObjReader.read_block.
 
-    return [
-        float(words[1]),
-        float(words[2])
-    ]
+        Only one chunk of text (and the v, vt, vn declared so far)
+        is held at once, so very large scans can be read in a
+        bounded amount of memory.
+    """
+
+    reader = ObjReader() if reader is None else reader
+    leftover = b""
+    with open(filename,'rb') as f:
+        chunk = f.read(chunk_size)
+        while chunk:
+            chunk = leftover + chunk
+            #only hand over whole lines, the rest waits for the next chunk
+            end = chunk.rfind(b"\n") + 1
+            leftover = chunk[end:]
+            if end:
+                yield reader.read_block(chunk[:end])
+            chunk = f.read(chunk_size)
+
+    if leftover:
+        yield reader.read_block(leftover)
+
+def estimate_vertex_count(filename: str) -> int:
+    """
+        Guess how many triangle corners an obj file holds from its size,
+        typical exports come out at roughly one corner per 36 bytes.
+    """
+
+    return os.path.getsize(filename) // 36 + 1
+
+def upload_in_pieces(
+    target: int, array: np.ndarray, piece_size: int = STREAM_UPLOAD_SIZE) -> None:
+    """
+        Allocate storage for the array in the buffer bound to target,
+        then copy it over piece_size bytes at a time, so the driver
+        never needs a staging copy of the whole thing.
+    """
+
+    glBufferData(target, array.nbytes, None, GL_STATIC_DRAW)
+
+    rows_per_piece = max(1, piece_size // max(1, array[:1].nbytes))
+    for first in range(0, len(array), rows_per_piece):
+        piece = array[first:first + rows_per_piece]
+        glBufferSubData(target, first * array[:1].nbytes, piece.nbytes, piece)
+
+def load_image(filepath: str) -> np.ndarray:
+    """
+        Decode the given image file into an (h, w, 4) RGBA uint8 array.
+    """
+
+    from PIL import Image
+
+    with Image.open(filepath, mode = "r") as image:
+        return np.asarray(image.convert("RGBA"))
+
+def load_cubemap_images(filepath: str) -> list[tuple[int, np.ndarray]]:
+    """
+        Decode the six faces of a cubemap, given the common start of
+        their filenames (eg. "gfx/sky" for "gfx/sky_left.png" etc.),
+        turned the right way round for the cubemap face they belong to.
+
+        Returns:
+
+            (cubemap face target, RGBA pixels) for each face.
+    """
+
+    from PIL import Image, ImageOps
+
+    faces = []
+    for filename, (target, orient) in zip(cubemap_filenames(filepath), (
+        (GL_TEXTURE_CUBE_MAP_NEGATIVE_Y, lambda img: img),
+        (GL_TEXTURE_CUBE_MAP_POSITIVE_Y, lambda img: ImageOps.mirror(ImageOps.flip(img))),
+        (GL_TEXTURE_CUBE_MAP_POSITIVE_Z, lambda img: img.rotate(90)),
+        (GL_TEXTURE_CUBE_MAP_NEGATIVE_Z, lambda img: img.rotate(90)),
+        (GL_TEXTURE_CUBE_MAP_NEGATIVE_X, lambda img: img.rotate(-90)),
+        (GL_TEXTURE_CUBE_MAP_POSITIVE_X, lambda img: img.rotate(90)),
+    )):
+        with Image.open(filename, mode = "r") as img:
+            faces.append((target, np.asarray(orient(img).convert("RGBA"))))
+
+    return faces
+
+def cubemap_filenames(filepath: str) -> list[str]:
+    """
+        Return the image files of the six faces of a cubemap,
+        given the common start of their filenames.
+    """
+
+    return [f"{filepath}_{suffix}.png" for suffix in CUBEMAP_SUFFIXES]
+
+def build_mipmaps(pixels: np.ndarray) -> list[np.ndarray]:
+    """
+        Return the full mip chain of an (h, w, 4) uint8 image, from
+        the image itself down to 1x1, each level a 2x2 box filter of
+        the one before (the same filter glGenerateMipmap uses).
+    """
+
+    levels = [pixels]
+    while pixels.shape[0] > 1 or pixels.shape[1] > 1:
+        #an odd row or column is dropped, a side of 1 stays 1
+        height, width = max(pixels.shape[0] // 2, 1), max(pixels.shape[1] // 2, 1)
+        rows = 2 if pixels.shape[0] > 1 else 1
+        columns = 2 if pixels.shape[1] > 1 else 1
+        blocks = pixels[:height * rows, :width * columns].reshape(
+            height, rows, width, columns, 4
+        )
+        pixels = (blocks.mean(axis = (1, 3), dtype=np.float32) + 0.5).astype(np.uint8)
+        levels.append(pixels)
+
+    return levels
+
+def texture_bytes(width: int, height: int, levels: int | None = 1) -> int:
+    """
+        Return the bytes an RGBA8 texture of the given size takes up
+        with its first levels mip levels, or its whole mip chain
+        down to 1x1 if levels is None.
+    """
+
+    total = 0
+    level = 0
+    while levels is None or level < levels:
+        total += width * height * 4
+        if width == height == 1:
+            break
+        width, height = max(width // 2, 1), max(height // 2, 1)
+        level += 1
+
+    return total
+
+def material_library_paths(filename: str, libraries: list[str]) -> list[str]:
+    """
+        Return the paths of the mtl files named by an obj file,
+        which are given relative to the obj file itself.
+    """
+
+    folder = os.path.dirname(filename)
+    return [os.path.join(folder, library) for library in libraries]
+
+def load_material_library(filename: str) -> dict[str, dict[str, Any]]:
+    """
+        Read the materials declared in an mtl file.
+
+        Returns:
+
+            For each material name, the properties used in rendering:
+            "Kd" and "Ks" the diffuse and specular colours, "Ns" the
+            specular exponent and "map_Kd" the path of the diffuse
+            texture, or None if it has none.
+    """
+
+    folder = os.path.dirname(filename)
+    materials = {}
+    material = None
+    with open(filename, 'r', errors = "replace") as f:
+        for line in f:
+            words = line.split()
+            if not words:
+                continue
+
+            if words[0] == "newmtl":
+                material = materials[" ".join(words[1:])] = {
+                    "Kd": (1.0, 1.0, 1.0),
+                    "Ks": (0.0, 0.0, 0.0),
+                    "Ns": 1.0,
+                    "map_Kd": None,
+                }
+            elif material is None:
+                continue
+            elif words[0] in ("Kd", "Ks") and len(words) >= 4:
+                material[words[0]] = tuple(float(word) for word in words[1:4])
+            elif words[0] == "Ns" and len(words) >= 2:
+                material["Ns"] = float(words[1])
+            elif words[0] == "map_Kd" and len(words) >= 2:
+                #any options come before the filename
+                material["map_Kd"] = os.path.join(folder, words[-1])
+
+    return materials
+
+def read_streamed_model(
+    filename: str) -> tuple[np.ndarray, None, list[Submesh], list[str]]:
+    """
+        Stream the given obj file into one (n, 8) vertex array,
+        it comes without indices. Like load_cached_model, its
+        submeshes and mtl files come with it, here the submeshes
+        are runs of triangles in file order.
+    """
+
+    reader = ObjReader()
+    vertices = GrowableBuffer(8, capacity = estimate_vertex_count(filename))
+    triangle_materials = []
+    for triangles, materials in stream_model_from_file(filename, reader = reader):
+        vertices.append(triangles)
+        triangle_materials.append(materials)
+
+    submeshes = find_submeshes(
+        np.concatenate(triangle_materials or [np.zeros(0, dtype=np.int32)]),
+        reader.materials
+    )
+    return vertices.view, None, submeshes, material_library_paths(filename, reader.libraries)
+
+class GrowableBuffer:
+    """
+        A float32 table rows can be appended to. The storage is
+        allocated up front and, when it runs out, resized in place
+        (realloc) rather than rebuilt by concatenation, so it never
+        needs much more memory than the rows it holds.
+    """
+
+
+    def __init__(self, columns: int, capacity: int = 1024):
+
+        self.data = np.empty((max(1, capacity), columns), dtype=np.float32)
+        self.size = 0
+
+    def __len__(self) -> int:
+
+        return self.size
+
+    def append(self, rows: np.ndarray) -> None:
+        """ Copy the given (n, columns) rows onto the end of the table. """
+
+        needed = self.size + len(rows)
+        if needed > len(self.data):
+            #refcheck makes this fail loudly if a view of the old storage is alive
+            self.data.resize(
+                (max(needed, len(self.data) * 5 // 4), self.data.shape[1]),
+                refcheck = True
+            )
+        self.data[self.size:needed] = rows
+        self.size = needed
+
+    @property
+    def view(self) -> np.ndarray:
+        """
+            The rows appended so far, only valid until the next append.
+        """
+
+        return self.data[:self.size]
+
+class ObjReader:
+    """
+        Reads obj data one block of whole lines at a time,
+        keeping every v, vt and vn declared so far so that faces
+        in later blocks can still refer back to them.
+    """
+
+
+    def __init__(self):
+
+        self.v = GrowableBuffer(3)
+        self.vt = GrowableBuffer(2)
+        self.vn = GrowableBuffer(3)
+        #every material named by usemtl, 0 ("") stands for none
+        self.materials = [""]
+        self.material = 0
+        #the mtl files named by mtllib
+        self.libraries: list[str] = []
+
+    def read_block(self, data: bytes) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Read a block of whole lines and return the corners of the
+            triangles its faces describe, as an (n, 8) float32 array,
+            and the material of each triangle, as an index into
+            self.materials.
+        """
+
+        if b"\t" in data or b"\r" in data:
+            data = data.replace(b"\t", b" ").replace(b"\r", b" ")
+
+        #a newline on either side means every line is wrapped in newlines,
+        #the spaces after are read past the end by read_digit_runs
+        text = b"".join((b"\n", data, b"\n", b" " * (16 - (len(data) + 2) % 8)))
+        data = np.frombuffer(text, dtype=np.uint8)
+
+        newlines = np.flatnonzero(data == ord("\n"))
+        line_starts = newlines[:-1] + 1
+        line_lengths = np.diff(newlines)
+
+        #classify every line by its keyword
+        first = data[line_starts]
+        second = data[line_starts + 1]
+        third = data[line_starts + 2]
+        is_v = (first == ord("v")) & (second == ord(" "))
+        is_vt = (first == ord("v")) & (second == ord("t")) & (third == ord(" "))
+        is_vn = (first == ord("v")) & (second == ord("n")) & (third == ord(" "))
+        is_f = (first == ord("f")) & (second == ord(" "))
+
+        #the few usemtl and mtllib lines are read one by one
+        is_usemtl = np.zeros(len(line_starts), dtype=bool)
+        used = []
+        for line in np.flatnonzero((first == ord("u")) | (first == ord("m"))):
+            keyword, _, name = text[
+                line_starts[line]:line_starts[line] + line_lengths[line]
+            ].decode(errors = "replace").strip().partition(" ")
+            if keyword == "usemtl":
+                is_usemtl[line] = True
+                name = name.strip()
+                if name not in self.materials:
+                    self.materials.append(name)
+                used.append(self.materials.index(name))
+            elif keyword == "mtllib":
+                self.libraries.append(name.strip())
+
+        #the material in use on every line
+        line_materials = np.array(
+            [self.material] + used, dtype=np.int32
+        )[np.cumsum(is_usemtl)]
+        if len(line_materials):
+            self.material = int(line_materials[-1])
+
+        declared_before = np.array([len(self.v), len(self.vt), len(self.vn)])
+
+        #read every number in the block in one pass, then hand each line's
+        #numbers to the reader for its keyword
+        run_starts, run_lengths, run_values = read_digit_runs(data)
+        first_runs = np.searchsorted(run_starts, newlines)
+        runs_per_line = np.diff(first_runs)
+
+        lines = data[1:newlines[-1] + 1]
+        for attributes, is_attribute, keyword_length, width in (
+            (self.v, is_v, 1, 3), (self.vt, is_vt, 2, 2), (self.vn, is_vn, 2, 3)):
+
+            values = read_decimal_runs(
+                data, run_starts, run_lengths, run_values,
+                first_runs[:-1][is_attribute], runs_per_line[is_attribute],
+                line_starts[is_attribute] + keyword_length, width
+            )
+            if values is None:
+                #not all plainly written, go through the lines token by token
+                values = read_attribute_block(
+                    *select_lines(lines, line_lengths, is_attribute, keyword_length), width
+                )
+            attributes.append(values)
+
+        runs = np.flatnonzero(np.repeat(is_f, runs_per_line))
+        corner_indices, corners_per_face = read_face_block(
+            data, run_starts[runs], run_values[runs], runs_per_line[is_f]
+        )
+
+        #resolve to 0-based indices, -1 means the corner didn't give one
+        corner_indices -= 1
+        relative = corner_indices < -1
+        if np.any(relative):
+            #negative indices count back from how many of each attribute
+            #had been declared when the face was read
+            declared = declared_before + np.stack(
+                (np.cumsum(is_v), np.cumsum(is_vt), np.cumsum(is_vn)), axis = 1
+            )[is_f]
+            declared = np.repeat(declared, corners_per_face, axis = 0)
+            corner_indices = np.where(relative, declared + corner_indices + 1, corner_indices)
+
+        corners = corner_indices[triangulate_faces(corners_per_face)]
+
+        vertices = np.empty((len(corners), 8), dtype=np.float32)
+        for attributes, column, start, end in (
+            (self.v, 0, 0, 3), (self.vt, 1, 3, 5), (self.vn, 2, 5, 8)):
+
+            present = corners[:, column] >= 0
+            if np.all(present):
+                vertices[:, start:end] = attributes.view[corners[:, column]]
+            else:
+                vertices[:, start:end] = 0
+                vertices[present, start:end] = attributes.view[corners[present, column]]
+
+        triangle_materials = np.repeat(
+            line_materials[is_f], np.maximum(corners_per_face - 2, 0)
+        )
+        return vertices, triangle_materials
+
+def select_lines(
+    lines: np.ndarray, line_lengths: np.ndarray,
+    mask: np.ndarray, keyword_length: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Gather the bytes of every line picked out by mask into one block,
+        blanking out the keyword at the start of each.
+
+        Returns:
+
+            The block of bytes, and the offset of each line within it.
+    """
+
+    block = lines[np.repeat(mask, line_lengths)]
+    block_starts = np.cumsum(line_lengths[mask]) - line_lengths[mask]
+    for i in range(keyword_length):
+        block[block_starts + i] = ord(" ")
+
+    return block, block_starts
+
+def split_tokens(block: np.ndarray) -> np.ndarray:
+    """
+        Return the offset of every whitespace separated token in the block.
+    """
+
+    separator = (block == ord(" ")) | (block == ord("\n"))
+    return np.flatnonzero(~separator[1:] & separator[:-1]) + 1
+
+def owner_of(offsets: np.ndarray, starts: np.ndarray, length: int) -> np.ndarray:
+    """
+        Given the sorted start offsets of segments covering a block of
+        the given length, return which segment each offset falls in.
+    """
+
+    marker = np.zeros(length, dtype=np.int32)
+    marker[starts] = 1
+    return np.cumsum(marker, dtype=np.int32)[offsets] - 1
+
+def read_digit_runs(
+    block: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+        Find every unbroken run of decimal digits in the block
+        and read it as an integer.
+
+        Returns:
+
+            The offset, length and value of each run.
+    """
+
+    is_digit = block - ord("0") < 10
+    #the block never starts or ends with a digit, so the edges come in pairs
+    edges = np.flatnonzero(is_digit[1:] != is_digit[:-1]) + 1
+    run_starts = edges[0::2]
+    run_lengths = edges[1::2] - run_starts
+
+    #take the 8 bytes from the start of each run as one little endian word,
+    #whatever follows the run is then shifted out of the top
+    if len(block) < 8 or np.any(is_digit[-8:]):
+        block = np.concatenate((block, np.full(8, ord(" "), dtype=np.uint8)))
+    windows = np.ndarray(
+        (len(block) - 7,), dtype="<u8", buffer = block, strides = (1,)
+    )
+    values = windows[run_starts]
+    values -= np.uint64(0x3030303030303030)
+    values <<= (8 * (8 - np.arange(9))).astype(np.uint64)[np.minimum(run_lengths, 8)]
+
+    #then add up neighbouring digits, pairs of them, then fours
+    for shift, scale, mask in (
+        (8, 10, 0x00FF00FF00FF00FF),
+        (16, 100, 0x0000FFFF0000FFFF),
+        (32, 10000, 0x00000000FFFFFFFF)):
+
+        lower = values >> np.uint64(shift)
+        values *= np.uint64(scale)
+        values += lower
+        values &= np.uint64(mask)
+    values = values.view(np.int64)
+
+    #the few longer runs are read digit by digit
+    for length in np.unique(run_lengths[run_lengths > 8]):
+        which = np.flatnonzero(run_lengths == length)
+        digits = block[run_starts[which, None] + np.arange(length)] - ord("0")
+        values[which] = digits @ 10 ** np.arange(length - 1, -1, -1)
+
+    return run_starts, run_lengths, values
+
+def read_decimal_runs(
+    block: np.ndarray, run_starts: np.ndarray, run_lengths: np.ndarray,
+    run_values: np.ndarray, first_runs: np.ndarray, runs_per_line: np.ndarray,
+    value_starts: np.ndarray, width: int) -> np.ndarray | None:
+    """
+        Read lines holding exactly width values, each written as
+        [-]whole.fraction, straight from the digit runs found by
+        read_digit_runs.
+
+        Parameters:
+
+            run_starts, run_lengths, run_values: every run in the block.
+
+            first_runs, runs_per_line: which runs are on each line.
+
+            value_starts: where the first value of each line may start,
+                just past its keyword.
+
+            width: the number of values on each line.
+
+        Returns:
+
+            The values as an (n, width) array, or None if
+            the lines aren't all written that way.
+    """
+
+    if np.any(runs_per_line != 2 * width):
+        return None
+
+    whole = first_runs[:, None] + np.arange(0, 2 * width, 2)
+    fraction = whole + 1
+    whole_starts = run_starts[whole]
+    fraction_starts = run_starts[fraction]
+    fraction_lengths = run_lengths[fraction]
+    fraction_ends = fraction_starts + fraction_lengths
+    before = block[whole_starts - 1]
+    signed = (before == ord("-")) | (before == ord("+"))
+    after = block[fraction_ends[:, -1]]
+
+    #every value comes a single space after the previous one
+    #(or the keyword), and has its whole part and fraction
+    #either side of a decimal point
+    previous_ends = np.empty_like(fraction_ends)
+    previous_ends[:, 0] = value_starts
+    previous_ends[:, 1:] = fraction_ends[:, :-1]
+    if not (
+        np.all(whole_starts - signed == previous_ends + 1)
+        and np.all(block[previous_ends] == ord(" "))
+        and np.all(fraction_starts == whole_starts + run_lengths[whole] + 1)
+        and np.all(block[fraction_starts - 1] == ord("."))
+        and np.all((after == ord(" ")) | (after == ord("\n")))):
+        return None
+
+    scale = 10.0 ** -np.arange(fraction_lengths.max(initial = 0) + 1)
+    values = run_values[whole] + run_values[fraction] * scale[fraction_lengths]
+    values[before == ord("-")] *= -1
+    return values.astype(np.float32)
+
+def read_attribute_block(
+    block: np.ndarray, block_starts: np.ndarray, width: int) -> np.ndarray:
+    """
+        Read the lines gathered by select_lines (eg. all the "v" lines)
+        and return the first width values of each as an (n, width) array.
+    """
+
+    token_starts = split_tokens(block)
+
+    plain = (block >= ord("0")) & (block <= ord("9"))
+    for character in " \n.-+":
+        plain |= block == ord(character)
+
+    if np.all(plain):
+        #read the digits either side of the decimal point as two integers
+        run_starts, run_lengths, run_values = read_digit_runs(block)
+        is_fraction = block[run_starts - 1] == ord(".")
+        scale = 10.0 ** -np.arange(run_lengths.max(initial = 0) + 1)
+
+        if len(run_starts) == 2 * len(token_starts) \
+            and np.all(is_fraction[1::2]) and not np.any(is_fraction[0::2]) \
+            and np.all(run_starts[0::2] - token_starts <= 1):
+            #every value written as [-]whole.fraction
+            values = run_values[0::2] + run_values[1::2] * scale[run_lengths[1::2]]
+        else:
+            run_tokens = owner_of(run_starts, token_starts, len(block))
+            values = np.zeros(len(token_starts), dtype=np.float64)
+            np.add.at(
+                values, run_tokens,
+                np.where(is_fraction, run_values * scale[run_lengths], run_values)
+            )
+
+        values[block[token_starts] == ord("-")] *= -1
+    else:
+        #exponents and the like, leave those to numpy's own parser
+        values = np.fromstring(block.tobytes(), dtype=np.float64, sep = " ")
+
+    #usually every line holds exactly width values
+    line_ends = np.append(block_starts[1:], len(block))
+    if len(token_starts) == width * len(block_starts) \
+        and np.all(token_starts[0::width] > block_starts) \
+        and np.all(token_starts[width - 1::width] < line_ends):
+        return values.reshape(-1, width).astype(np.float32)
+
+    #ragged lines (eg. optional w components), keep the first width values
+    token_lines = owner_of(token_starts, block_starts, len(block))
+    tokens_per_line = np.bincount(token_lines, minlength = len(block_starts))
+    rank = np.arange(len(token_lines)) \
+        - (np.cumsum(tokens_per_line) - tokens_per_line)[token_lines]
+    keep = rank < width
+    table = np.zeros((len(block_starts), width), dtype=np.float32)
+    table[token_lines[keep], rank[keep]] = values[keep]
+    return table
+
+def read_face_block(
+    block: np.ndarray, run_starts: np.ndarray, run_values: np.ndarray,
+    runs_per_face: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Read the faces from the digit runs found on their lines
+        by read_digit_runs. Each corner may be given as
+        "v", "v/vt", "v//vn" or "v/vt/vn".
+
+        Returns:
+
+            An (n, 3) array of the raw v, vt, vn index of every corner,
+            with 0 standing in for an index that wasn't given,
+            and the number of corners in each face.
+    """
+
+    negative = block[run_starts - 1] == ord("-")
+    run_values = np.where(negative, -run_values, run_values)
+
+    #an index starts a new corner unless it follows a slash,
+    #and the slashes since the corner started say which index it is
+    before = run_starts - 1 - negative
+    slashes = (block[before] == ord("/")).astype(np.int64)
+    slashes += (slashes == 1) & (block[before - 1] == ord("/"))
+
+    #usually every corner is written the same way (eg. all "v/vt/vn"),
+    #then the indices already lie in rows of the same width
+    for pattern, fields in (
+        ((0, 1, 1), [0, 1, 2]), ((0, 2), [0, 2]), ((0, 1), [0, 1]), ((0,), [0])):
+
+        if len(slashes) % len(pattern) == 0 \
+            and np.all(slashes.reshape(-1, len(pattern)) == pattern):
+
+            corner_indices = np.zeros((len(slashes) // len(pattern), 3), dtype=np.int64)
+            corner_indices[:, fields] = run_values.reshape(-1, len(pattern))
+            corners_per_face = runs_per_face // len(pattern)
+            if np.all(corners_per_face * len(pattern) == runs_per_face):
+                return corner_indices, corners_per_face
+
+    new_corner = slashes == 0
+    run_corners = np.cumsum(new_corner) - 1
+    total_slashes = np.cumsum(slashes)
+    fields = total_slashes - total_slashes[np.flatnonzero(new_corner)][run_corners]
+
+    corner_indices = np.zeros((np.count_nonzero(new_corner), 3), dtype=np.int64)
+    keep = fields < 3
+    corner_indices[run_corners[keep], fields[keep]] = run_values[keep]
+
+    #the first corner of each face is the one its first run falls in
+    first_run = np.cumsum(runs_per_face) - runs_per_face
+    first_corner = np.append(run_corners, len(corner_indices))[first_run]
+    corners_per_face = np.diff(np.append(first_corner, len(corner_indices)))
+
+    return corner_indices, corners_per_face
+
+def triangulate_faces(corners_per_face: np.ndarray) -> np.ndarray:
+    """
+        Fan-triangulate the faces, given how many corners each one has,
+        and return the corner ids making up every triangle, three per triangle.
+    """
+
+    triangles_per_face = np.maximum(corners_per_face - 2, 0)
+    first_corner = np.cumsum(corners_per_face) - corners_per_face
+
+    face = np.repeat(np.arange(len(corners_per_face)), triangles_per_face)
+    first_triangle = np.cumsum(triangles_per_face) - triangles_per_face
+    i = np.arange(len(face)) - first_triangle[face]
+
+    base = first_corner[face]
+    return np.stack((base, base + i + 1, base + i + 2), axis = 1).ravel()
 
-def read_normal_data(words: list[str]) -> list[float]:
-    """ 
-        read the given normal description and
-        return the normal it represents.
+############################## mesh optimisation ##############################
+
+def index_vertices(vertices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Remove duplicate vertices from a triangle list.
+
+        Parameters:
+
+            vertices: (n, 8) float32 array, three rows per triangle
+
+        Returns:
+
+            The unique vertices and the uint32 indices into them
+            which rebuild the original triangle list.
+    """
+
+    vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+    #compare whole rows at once by viewing each one as a single blob of bytes
+    rows = vertices.view(np.dtype((np.void, vertices.dtype.itemsize * vertices.shape[1])))
+    _, first, indices = np.unique(rows.ravel(), return_index = True, return_inverse = True)
+
+    return vertices[first], indices.astype(np.uint32).ravel()
+
+def optimize_vertex_cache(
+    indices: np.ndarray, vertex_count: int,
+    cache_size: int = VERTEX_CACHE_SIZE) -> np.ndarray:
+    """
+        Reorder the triangles of an index buffer so that vertices are
+        reused while they are still in the post-transform cache.
+
+        This is Tipsify (Sander, Nehab & Barczak, 2007): fan out around
+        a vertex, then move on to whichever vertex the fan just touched
+        that will still be cached and has triangles left.
     """
 
+    triangles = indices.reshape(-1, 3).tolist()
+    corners = indices.astype(np.int64)
+
+    #triangles around each vertex, as offsets into one flat list
+    live = np.bincount(corners, minlength = vertex_count)
+    offsets = np.concatenate(([0], np.cumsum(live))).tolist()
+    adjacency = (np.argsort(corners, kind = "stable") // 3).tolist()
+    live = live.tolist()
+
+    emitted = [False] * len(triangles)
+    cache_time = [0] * vertex_count
+    dead_end = []
+    output = []
+    time = cache_size + 1
+    cursor = 0
+    fanning = 0 if vertex_count else -1
+
+    while fanning >= 0:
+
+        candidates = []
+        for triangle in adjacency[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[triangle]:
+                continue
+            emitted[triangle] = True
+            for vertex in triangles[triangle]:
+                output.append(vertex)
+                dead_end.append(vertex)
+                candidates.append(vertex)
+                live[vertex] -= 1
+                if time - cache_time[vertex] > cache_size:
+                    cache_time[vertex] = time
+                    time += 1
+
+        #best candidate which will still be in the cache once its fan is done
+        fanning = -1
+        best = -1
+        for vertex in candidates:
+            if live[vertex] > 0:
+                priority = 0
+                if time - cache_time[vertex] + 2 * live[vertex] <= cache_size:
+                    priority = time - cache_time[vertex]
+                if priority > best:
+                    best = priority
+                    fanning = vertex
+
+        if fanning < 0:
+            #dead end, go back to a recently used vertex
+            while dead_end:
+                vertex = dead_end.pop()
+                if live[vertex] > 0:
+                    fanning = vertex
+                    break
+
+        if fanning < 0:
+            #otherwise take the next vertex in order which isn't finished
+            while cursor < vertex_count and live[cursor] == 0:
+                cursor += 1
+            if cursor < vertex_count:
+                fanning = cursor
+
+    return np.array(output, dtype=np.uint32)
+
+def order_vertices_by_use(
+    vertices: np.ndarray, indices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Renumber the vertices in the order the index buffer first
+        uses them, so vertex fetches walk forwards through memory.
+    """
+
+    used, first_use = np.unique(indices, return_index = True)
+    order = used[np.argsort(first_use)]
+
+    remap = np.zeros(len(vertices), dtype=np.uint32)
+    remap[order] = np.arange(len(order), dtype=np.uint32)
+
+    return vertices[order], remap[indices]
+
+def calculate_acmr(
+    indices: np.ndarray, cache_size: int = VERTEX_CACHE_SIZE) -> float:
+    """
+        Return the average cache miss ratio of an index buffer,
+        ie. how many times the vertex shader runs per triangle,
+        using a FIFO post-transform cache of the given size.
+        3.0 is the worst case (no reuse at all), 0.5 is about the best.
+    """
+
+    if len(indices) == 0:
+        return 0.0
+
+    cache = [-1] * cache_size
+    cached = set()
+    head = 0
+    misses = 0
+    for vertex in indices.tolist():
+        if vertex not in cached:
+            misses += 1
+            cached.discard(cache[head])
+            cache[head] = vertex
+            cached.add(vertex)
+            head = (head + 1) % cache_size
+
+    return 3 * misses / len(indices)
+
+def build_indexed_mesh(
+    vertices: np.ndarray,
+    triangle_groups: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Turn an (n, 8) triangle list into unique vertices and uint32
+        indices, ordered for the post-transform and fetch caches.
+
+        If a group (eg. material) is given for each triangle, the
+        triangles come out sorted by group so each group is one
+        range of the indices, and each range is ordered on its own.
+    """
+
+    vertices, indices = index_vertices(vertices)
+    if triangle_groups is None:
+        indices = optimize_vertex_cache(indices, len(vertices))
+    else:
+        indices = order_triangles(indices, len(vertices), triangle_groups)
+    return order_vertices_by_use(vertices, indices)
+
+def order_triangles(
+    indices: np.ndarray, vertex_count: int,
+    triangle_groups: np.ndarray) -> np.ndarray:
+    """
+        Sort the triangles by group, then order each group's range
+        for the post-transform cache, see optimize_vertex_cache.
+    """
+
+    order = np.argsort(triangle_groups, kind = "stable")
+    triangles = indices.reshape(-1, 3)[order]
+    ends = np.cumsum(np.bincount(triangle_groups[order]))[:-1]
+    return np.concatenate([np.zeros(0, dtype=np.uint32)] + [
+        optimize_vertex_cache(group.ravel(), vertex_count)
+        for group in np.split(triangles, ends)
+    ])
+
+def simplify_mesh(
+    vertices: np.ndarray, indices: np.ndarray,
+    triangle_groups: np.ndarray, target_count: int,
+    max_error: float = np.inf) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Simplify a mesh by collapsing edges, cheapest first by quadric
+        error (Garland & Heckbert, 1997), until only target_count
+        triangles are left or no more collapses are allowed.
+
+        A collapse moves one end of an edge onto the other, so the
+        simplified triangles index the same vertices as the original.
+        Where one position has several vertices (a seam in the texture
+        coordinates or normals), it only collapses along the seam, each
+        vertex onto its own partner, so seams stay sharp. Positions on
+        open borders or between groups never move, and collapses which
+        would turn a triangle over are skipped.
+
+        Parameters:
+
+            vertices, indices: the (n, 8) vertices and uint32 indices
+
+            triangle_groups: the group (eg. material) of each triangle
+
+            target_count: how many triangles to stop at
+
+            max_error: how far from the original surface (roughly)
+                       collapses may move it
+
+        Returns:
+
+            The uint32 indices of the remaining triangles, and their groups.
+    """
+
+    positions, position_of = np.unique(vertices[:, 0:3], axis = 0, return_inverse = True)
+    positions = positions.astype(np.float64)
+    position_of = position_of.ravel()
+    count = len(positions)
+    triangles = indices.reshape(-1, 3).astype(np.int64)
+    groups = np.asarray(triangle_groups)
+    corners = position_of[triangles]
+
+    #the error quadric of each position, from the planes of its triangles
+    points = positions[corners]
+    normals = np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+    lengths = np.linalg.norm(normals, axis = 1, keepdims = True)
+    normals = np.divide(normals, lengths, out = np.zeros_like(normals), where = lengths > 0)
+    planes = np.c_[normals, -(normals * points[:, 0]).sum(axis = 1)]
+    quadrics = np.zeros((count, 4, 4))
+    for corner in range(3):
+        np.add.at(quadrics, corners[:, corner], planes[:, :, None] * planes[:, None, :])
+
+    #open or shared by more than two triangles, its ends are on a border
+    sides = np.sort(corners[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis = 1)
+    keys, uses = np.unique(sides[:, 0] * count + sides[:, 1], return_counts = True)
+    locked = np.zeros(count, dtype=bool)
+    locked[keys[uses != 2] // count] = True
+    locked[keys[uses != 2] % count] = True
+    #as are positions between groups
+    lowest = np.full(count, groups.max(initial = 0), dtype=np.int64)
+    highest = np.zeros(count, dtype=np.int64)
+    np.minimum.at(lowest, corners.ravel(), np.repeat(groups, 3))
+    np.maximum.at(highest, corners.ravel(), np.repeat(groups, 3))
+    locked |= lowest != highest
+
+    while len(triangles) > target_count:
+
+        corners = position_of[triangles]
+        #every side of every triangle, both ways round
+        start = triangles[:, [0, 1, 2, 1, 2, 0]].ravel()
+        end = triangles[:, [1, 2, 0, 0, 1, 2]].ravel()
+
+        #position u can move onto position v if each of its vertices
+        #has an edge to a vertex at v
+        used = np.unique(triangles)
+        vertices_at = np.bincount(position_of[used], minlength = count)
+        partners = np.unique(start * count + position_of[end])
+        keys, partnered = np.unique(
+            position_of[partners // count] * count + partners % count, return_counts = True)
+        u, v = keys // count, keys % count
+        allowed = (partnered == vertices_at[u]) & ~locked[u]
+        u, v = u[allowed], v[allowed]
+
+        #error of the combined quadric at v, only the cheapest are looked at
+        q = np.c_[positions[v], np.ones(len(v))]
+        cost = np.einsum("ni,nij,nj->n", q, quadrics[u] + quadrics[v], q)
+        needed = len(triangles) - target_count
+        cheapest = np.argsort(cost, kind = "stable")[:2 * needed]
+        cheapest = cheapest[cost[cheapest] <= max_error ** 2]
+        u, v = u[cheapest], v[cheapest]
+
+        #triangles around each position, as offsets into one flat list
+        around = np.bincount(corners.ravel(), minlength = count)
+        offsets = np.concatenate(([0], np.cumsum(around)))
+        adjacency = np.argsort(corners.ravel(), kind = "stable") // 3
+
+        #every (collapse, triangle around u) pair, skip collapses which turn one over
+        sizes = around[u]
+        collapse = np.repeat(np.arange(len(u)), sizes)
+        nth = np.arange(len(collapse)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        triangle = adjacency[offsets[u][collapse] + nth]
+        before = corners[triangle]
+        after = np.where(before == u[collapse, None], v[collapse, None], before)
+        survives = ~np.any(before == v[collapse, None], axis = 1)
+        old = positions[before]
+        new = positions[after]
+        old_normal = np.cross(old[:, 1] - old[:, 0], old[:, 2] - old[:, 0])
+        new_normal = np.cross(new[:, 1] - new[:, 0], new[:, 2] - new[:, 0])
+        turned = survives & ((old_normal * new_normal).sum(axis = 1) < LOD_MAX_TURN
+            * np.linalg.norm(old_normal, axis = 1) * np.linalg.norm(new_normal, axis = 1))
+        safe = np.bincount(collapse[turned], minlength = len(u)) == 0
+
+        #collapse as many as needed, none of them touching the same triangles
+        touched = np.zeros(count, dtype=bool)
+        chosen = []
+        removed = 0
+        offsets, moves, ontos = offsets.tolist(), u.tolist(), v.tolist()
+        for i in np.flatnonzero(safe).tolist():
+            if touched[moves[i]] or touched[ontos[i]]:
+                continue
+            chosen.append(i)
+            touched[corners[adjacency[offsets[moves[i]]:offsets[moves[i] + 1]]]] = True
+            #each collapse takes the two triangles along the edge with it
+            removed += 2
+            if removed >= needed:
+                break
+        if not chosen:
+            break
+
+        onto = np.full(count, -1, dtype=np.int64)
+        onto[u[chosen]] = v[chosen]
+        quadrics[v[chosen]] += quadrics[u[chosen]]
+        moving = onto[position_of[start]] == position_of[end]
+        remap = np.arange(len(vertices))
+        remap[start[moving]] = end[moving]
+
+        triangles = remap[triangles]
+        corners = position_of[triangles]
+        kept = (corners[:, 0] != corners[:, 1]) & (corners[:, 1] != corners[:, 2]) \
+            & (corners[:, 2] != corners[:, 0])
+        triangles, groups = triangles[kept], groups[kept]
+
+    return triangles.ravel().astype(np.uint32), groups
+
+def build_lod_chain(
+    vertices: np.ndarray, indices: np.ndarray,
+    triangle_groups: np.ndarray) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+        Make the simplified levels of detail of an indexed mesh,
+        each from the one before, with the share of its triangles
+        given by LOD_RATIOS. Levels which barely simplify anything
+        are left out.
+
+        Returns:
+
+            The indices and triangle groups of each level, each group
+            one range of the indices as in build_indexed_mesh.
+    """
+
+    levels = []
+    full_count = len(indices) // 3
+    used = vertices[np.unique(indices), 0:3]
+    size = float(np.max(used.max(axis = 0, initial = 0) - used.min(axis = 0, initial = 0)))
+    for level, ratio in enumerate(LOD_RATIOS):
+        previous = len(indices) // 3
+        indices, triangle_groups = simplify_mesh(
+            vertices, indices, triangle_groups, int(full_count * ratio),
+            max_error = LOD_MAX_ERROR * 2 ** level * size)
+        if len(indices) // 3 > 0.9 * previous:
+            break
+
+        indices = order_triangles(indices, len(vertices), triangle_groups)
+        triangle_groups = np.sort(triangle_groups)
+        levels.append((indices, triangle_groups))
+
+    return levels
+
+def find_submeshes(
+    triangle_materials: np.ndarray, material_names: list[str]) -> list[Submesh]:
+    """
+        Split a list of triangles into runs sharing a material,
+        given the material of each triangle as an index into
+        material_names. Returns a Submesh for each run.
+    """
+
+    run_starts = np.flatnonzero(np.diff(triangle_materials, prepend = -1))
+    run_ends = np.append(run_starts[1:], len(triangle_materials))
+
     return [
-        float(words[1]),
-        float(words[2]),
-        float(words[3])
+        Submesh(3 * start, 3 * (end - start), material_names[triangle_materials[start]] or None)
+        for start, end in zip(run_starts.tolist(), run_ends.tolist())
     ]
 
-def read_face_data(
-    words: list[str], 
-    v: list[float], vt: list[float], vn: list[float], 
-    vertices: list[float]) -> None:
+def report_mesh_statistics(folder: str) -> None:
     """
-        Read the given face description, and use the
-        data from the pre-filled v, vt, vn arrays to add
-        data to the vertices array
+        Print, for every obj model in the given folder, how many
+        vertices indexing saves and the ACMR of its triangles before
+        and after they are reordered for the vertex cache.
     """
-    
-    triangles_in_face = len(words) - 3
 
-    for i in range(triangles_in_face):
-        read_corner(words[1], v, vt, vn, vertices)
-        read_corner(words[i + 2], v, vt, vn, vertices)
-        read_corner(words[i + 3], v, vt, vn, vertices)
+    print(f"{'model':<20}{'corners':>10}{'unique':>10}{'saved':>8}"
+          f"{'ACMR in':>10}{'ACMR out':>10}")
+
+    for filename in sorted(os.listdir(folder)):
+        if not filename.endswith(".obj"):
+            continue
+        try:
+            corners = load_model_from_file(os.path.join(folder, filename)).reshape(-1, 8)
+        except (IndexError, ValueError) as error:
+            print(f"{filename:<20}could not be read: {error}")
+            continue
 
-def read_corner(
-    description: str, 
-    v: list[float], vt: list[float], vn: list[float], 
-    vertices: list[float]) -> None:
+        vertices, indices = index_vertices(corners)
+        before = calculate_acmr(indices)
+        vertices, indices = build_indexed_mesh(corners)
+        after = calculate_acmr(indices)
+
+        saved = 1 - len(vertices) / max(len(corners), 1)
+        print(f"{filename:<20}{len(corners):>10}{len(vertices):>10}{saved:>8.0%}"
+              f"{before:>10.3f}{after:>10.3f}")
+
+############################## cache files ####################################
+
+def source_stamp(sources: str | list[str]) -> int:
+    """
+        Return the modification time (in nanoseconds) of the given
+        file, or for a list of files their times xor'ed together,
+        so touching any one of them changes the stamp.
+    """
+
+    if isinstance(sources, str):
+        sources = [sources]
+    stamp = 0
+    for filename in sources:
+        stamp ^= os.stat(filename).st_mtime_ns
+    return stamp
+
+def source_key(sources: str | list[str]) -> tuple[int, bytes]:
+    """
+        Return the modification stamp and sha1 digest of the given
+        file, or list of files, together these identify the version
+        of the source a cache was built from.
+    """
+
+    digest = hashlib.sha1()
+    for filename in [sources] if isinstance(sources, str) else sources:
+        with open(filename, 'rb') as f:
+            digest.update(f.read())
+
+    return source_stamp(sources), digest.digest()
+
+def write_cache_file(
+    cache_path: str, source_path: str | list[str], layout: str,
+    sections: dict[str, np.ndarray]) -> None:
+    """
+        Write the given arrays to a binary cache file.
+
+        Parameters:
+
+            cache_path: where to write the cache
+
+            source_path: the file, or list of files, the arrays were
+                built from, their mtime and hash are stored to detect
+                stale caches
+
+            layout: a short description of how the arrays are laid out,
+                a cache with a different layout is never reused
+
+            sections: named 1D or 2D arrays to store
+    """
+
+    #the header has room for 16 bytes, a longer layout would be cut
+    #short and then never match when read back
+    if len(layout.encode()) > 16:
+        raise ValueError(f"cache layout {layout!r} is longer than 16 bytes")
+
+    mtime, digest = source_key(source_path)
+
+    #header, then the section table, then each array aligned for mapping
+    offset = CACHE_HEADER.size + CACHE_SECTION.size * len(sections)
+    table = []
+    for name, array in sections.items():
+        array = np.ascontiguousarray(array)
+        offset += -offset % CACHE_ALIGNMENT
+        #1D arrays are stored with 0 columns
+        columns = array.shape[1] if array.ndim == 2 else 0
+        table.append((name, array, len(array), columns, offset))
+        offset += array.nbytes
+
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, 'wb') as f:
+            f.write(CACHE_HEADER.pack(
+                CACHE_MAGIC, CACHE_VERSION, mtime, digest,
+                layout.encode(), len(table)
+            ))
+            for name, array, rows, columns, offset in table:
+                f.write(CACHE_SECTION.pack(
+                    name.encode(), array.dtype.str.encode(), rows, columns, offset
+                ))
+            for name, array, rows, columns, offset in table:
+                f.write(bytes(offset - f.tell()))
+                f.write(array.reshape(-1).view(np.uint8).data)
+        #swap the finished file in so a reader never sees half of one
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        #a read only asset folder just means no caching
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+def read_cache_file(
+    cache_path: str, source_path: str | list[str], layout: str) -> dict[str, np.ndarray] | None:
+    """
+        Memory map the arrays stored in a cache file.
+
+        Returns:
+
+            The named arrays, or None if there is no usable cache,
+            ie. it is missing, was written by a different version or layout,
+            or the source has changed since it was built.
+    """
+
+    try:
+        with open(cache_path, 'rb') as f:
+            magic, version, mtime, digest, cached_layout, count = \
+                CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+            if magic != CACHE_MAGIC or version != CACHE_VERSION \
+                or cached_layout.rstrip(b"\0").decode() != layout:
+                return None
+            table = [
+                CACHE_SECTION.unpack(f.read(CACHE_SECTION.size))
+                for _ in range(count)
+            ]
+
+        source_mtime = source_stamp(source_path)
+        if source_mtime != mtime:
+            #touched but maybe not changed, the hash has the final say
+            if source_key(source_path)[1] != digest:
+                return None
+            with open(cache_path, 'r+b') as f:
+                f.write(CACHE_HEADER.pack(
+                    magic, version, source_mtime, digest, cached_layout, count
+                ))
+    except (OSError, struct.error):
+        return None
+
+    cache_size = os.path.getsize(cache_path)
+    sections = {}
+    for name, dtype, rows, columns, offset in table:
+        name = name.rstrip(b"\0").decode()
+        dtype = np.dtype(dtype.rstrip(b"\0").decode())
+        shape = (rows, columns) if columns else (rows,)
+        if offset + dtype.itemsize * rows * max(columns, 1) > cache_size:
+            #cut short, eg. by a full disk
+            return None
+        if rows == 0:
+            #an empty file region can't be mapped
+            sections[name] = np.zeros(shape, dtype=dtype)
+        else:
+            sections[name] = np.memmap(
+                cache_path, dtype=dtype, mode = 'r',
+                offset = offset, shape = shape
+            )
+    return sections
+
+def load_cached_model(
+    filename: str) -> tuple[np.ndarray, np.ndarray, list[Submesh], list[str]]:
+    """
+        Return the indexed geometry of the given obj file, as
+        an (n, 8) float32 array of unique vertices, the uint32
+        indices of its triangles, a Submesh for each material's
+        range of the indices, and the mtl files it names.
+
+        The indices of the simplified levels of detail (see
+        build_lod_chain) follow the full mesh's, and each level
+        has its own submeshes.
+
+        The first load parses and optimizes the obj and writes a
+        binary sidecar next to it, later loads memory map that sidecar
+        instead, so the data can go straight to the graphics card.
+    """
+
+    cache_path = filename + MESH_CACHE_SUFFIX
+    sections = read_cache_file(cache_path, filename, MESH_LAYOUT)
+    if sections is not None:
+        names = bytes(sections["materials"]).decode().split("\n")
+        submeshes = [
+            Submesh(first, count, names[material] or None, level)
+            for level, first, count, material in sections["submeshes"].tolist()
+        ]
+        libraries = bytes(sections["libraries"]).decode().split("\n")
+        return sections["vertices"], sections["indices"], submeshes, \
+            [library for library in libraries if library]
+
+    reader = ObjReader()
+    with open(filename,'rb') as f:
+        vertices, triangle_materials = reader.read_block(f.read())
+    vertices, indices = build_indexed_mesh(vertices, triangle_materials)
+    triangle_materials = np.sort(triangle_materials)
+    submeshes = find_submeshes(triangle_materials, reader.materials)
+    libraries = material_library_paths(filename, reader.libraries)
+
+    #each level's indices go after the last, its submeshes follow suit
+    levels = [indices]
+    for level, (lod_indices, lod_materials) in enumerate(
+        build_lod_chain(vertices, indices, triangle_materials), start = 1):
+        offset = sum(len(level_indices) for level_indices in levels)
+        for submesh in find_submeshes(lod_materials, reader.materials):
+            submeshes.append(
+                Submesh(offset + submesh.first, submesh.count, submesh.material, level))
+        levels.append(lod_indices)
+    indices = np.concatenate(levels)
+
+    write_cache_file(
+        cache_path, filename, MESH_LAYOUT,
+        {
+            "vertices": vertices,
+            "indices": indices,
+            "submeshes": np.array(
+                [
+                    (submesh.level, submesh.first, submesh.count,
+                        reader.materials.index(submesh.material or ""))
+                    for submesh in submeshes
+                ], dtype=np.uint32
+            ).reshape(-1, 4),
+            "materials": np.frombuffer("\n".join(reader.materials).encode(), dtype=np.uint8),
+            "libraries": np.frombuffer("\n".join(libraries).encode(), dtype=np.uint8),
+        }
+    )
+    return vertices, indices, submeshes, libraries
+
+def load_cached_texture(filepath: str, mipmaps: bool = True) -> list[np.ndarray]:
     """
-        Read the given corner description, then send the
-        approprate v, vt, vn data to the vertices array.
+        Return the decoded (h, w, 4) RGBA pixels of the given image,
+        followed by the rest of its mip chain if mipmaps is set.
+
+        Like load_cached_model, the first load decodes the image and
+        writes the raw pixels to a sidecar, later loads memory map them.
     """
 
-    v_vt_vn = description.split("/")
+    layout = f"{TEXTURE_LAYOUT}/mips" if mipmaps else TEXTURE_LAYOUT
+    cache_path = filepath + TEXTURE_CACHE_SUFFIX
+    sections = read_cache_file(cache_path, filepath, layout)
+    if sections is not None:
+        return [level.reshape(len(level), -1, 4) for level in sections.values()]
+
+    pixels = load_image(filepath)
+    levels = build_mipmaps(pixels) if mipmaps else [pixels]
+    write_cache_file(
+        cache_path, filepath, layout,
+        {f"level{i}": level.reshape(len(level), -1) for i, level in enumerate(levels)}
+    )
+    return levels
+
+def load_cached_cubemap(filepath: str) -> list[tuple[int, np.ndarray]]:
+    """
+        Return the (face target, RGBA pixels) pairs of a cubemap, see
+        load_cubemap_images, cached the same way as load_cached_texture
+        with the pixels already turned the right way round.
+    """
 
-    for x in v[int(v_vt_vn[0]) - 1]:
-        vertices.append(x)
-    for x in vt[int(v_vt_vn[1]) - 1]:
-        vertices.append(x)
-    for x in vn[int(v_vt_vn[2]) - 1]:
-        vertices.append(x)
+    sources = cubemap_filenames(filepath)
+    cache_path = filepath + TEXTURE_CACHE_SUFFIX
+    sections = read_cache_file(cache_path, sources, TEXTURE_LAYOUT)
+    if sections is not None:
+        return [
+            (GL_TEXTURE_CUBE_MAP_POSITIVE_X + int(name[4:]), face.reshape(len(face), -1, 4))
+            for name, face in sections.items()
+        ]
+
+    faces = load_cubemap_images(filepath)
+    write_cache_file(
+        cache_path, sources, TEXTURE_LAYOUT,
+        {
+            f"face{target - GL_TEXTURE_CUBE_MAP_POSITIVE_X}": pixels.reshape(len(pixels), -1)
+            for target, pixels in faces
+        }
+    )
+    return faces
+
+def report_texture_load_times(filepath: str) -> None:
+    """
+        Print how long the given cubemap takes to load cold, ie.
+        decoded from its images, and warm, from the texture cache.
+        Both include reading every pixel once, as an upload would.
+    """
+
+    cache_path = filepath + TEXTURE_CACHE_SUFFIX
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+
+    for label in ("cold", "warm"):
+        start = time.perf_counter()
+        faces = load_cached_cubemap(filepath)
+        for _, pixels in faces:
+            pixels.max()
+        elapsed = time.perf_counter() - start
+        print(f"{filepath} {label}: {elapsed * 1000:.1f} ms")
+        #let go of the mapping before the next pass
+        del faces
 
 ###############################################################################
 
+class CacheCounters:
+    """
+        Counts how often cached transforms were reused and how often
+        they had to be recalculated, since the counters were last reset.
+    """
+
+
+    def __init__(self):
+
+        self.hits = 0
+        self.recomputed = 0
+
+    def reset(self) -> tuple[int, int]:
+        """ Return the hits and recomputations so far and start again. """
+
+        counts = (self.hits, self.recomputed)
+        self.hits = 0
+        self.recomputed = 0
+        return counts
+
+#shared by every transform store and camera, reset each frame
+TRANSFORM_COUNTERS = CacheCounters()
+
+class TransformStore:
+    """
+        The positions, rotations and tints of many entities, kept
+        together in contiguous arrays (a row per entity) so that all of
+        their model transforms can be calculated in one pass, straight
+        into an array which is ready to upload.
+
+        Each row also keeps a copy of the position and eulers its
+        transform was made from. Comparing against these copies finds
+        the rows which changed, however they were changed (assigned or
+        edited in place), and only those are recalculated.
+    """
+
+
+    def __init__(self, capacity: int = INSTANCE_CAPACITY):
+
+        self.positions = np.zeros((capacity, 3), dtype=np.float32)
+        self.eulers = np.zeros((capacity, 3), dtype=np.float32)
+        self.tints = np.ones((capacity, 4), dtype=np.float32)
+        self.transforms = np.zeros((capacity, 4, 4), dtype=np.float32)
+        #position and eulers each transform was made from, nan forces a remake
+        self.computed = np.full((capacity, 6), np.nan, dtype=np.float32)
+        #position and eulers at the start of the last simulation tick,
+        #transforms are made this far (0 to 1) on from them to the current
+        self.previous = np.full((capacity, 6), np.nan, dtype=np.float32)
+        self.alpha = 1.0
+        #level of detail each entity was last drawn with
+        self.levels = np.zeros(capacity, dtype=np.int32)
+        #the entity using each row
+        self.entities: list[Entity] = []
+        #counts every row given out or freed, so others can tell cheaply
+        #whether the entities changed
+        self.generation = 0
+
+    def __len__(self) -> int:
+
+        return len(self.entities)
+
+    def add(self, entity: Entity) -> int:
+        """ Give the entity the next free row and return it. """
+
+        row = len(self.entities)
+        if row == len(self.positions):
+            #entities look their rows up on every access,
+            #so moving everything to bigger arrays is safe
+            for name in ("positions", "eulers", "tints", "transforms",
+                "computed", "previous", "levels"):
+                old = getattr(self, name)
+                new = np.zeros((2 * len(old),) + old.shape[1:], dtype=old.dtype)
+                new[:row] = old
+                setattr(self, name, new)
+            self.tints[row:] = 1
+            self.computed[row:] = np.nan
+            self.previous[row:] = np.nan
+
+        self.entities.append(entity)
+        self.generation += 1
+        return row
+
+    def remove(self, entity: Entity) -> None:
+        """ Free the entity's row, moving the last row into it. """
+
+        row = entity.row
+        last = len(self.entities) - 1
+        moved = self.entities.pop()
+        if moved is not entity:
+            for array in (self.positions, self.eulers, self.tints,
+                self.transforms, self.computed, self.previous, self.levels):
+                array[row] = array[last]
+            self.entities[row] = moved
+            moved.row = row
+        self.tints[last] = 1
+        self.computed[last] = np.nan
+        self.previous[last] = np.nan
+        self.levels[last] = 0
+        entity.row = -1
+        self.generation += 1
+
+    def update_transforms(self, rows: slice = slice(None)) -> np.ndarray:
+        """
+            Bring the model transforms of the given rows (by default
+            every entity in the store) up to date, recalculating only
+            those whose entity moved, and return the (n, 4, 4) transforms.
+        """
+
+        rows = slice(*rows.indices(len(self.entities)))
+        positions, eulers = self.blend(rows)
+        computed = self.computed[rows]
+        transforms = self.transforms[rows]
+
+        dirty = np.flatnonzero(
+            np.any(positions != computed[:, 0:3], axis = 1)
+            | np.any(eulers != computed[:, 3:6], axis = 1)
+        )
+        TRANSFORM_COUNTERS.hits += len(transforms) - len(dirty)
+        TRANSFORM_COUNTERS.recomputed += len(dirty)
+
+        if len(dirty) == len(transforms):
+            create_model_transforms(positions, eulers, out = transforms)
+            computed[:, 0:3] = positions
+            computed[:, 3:6] = eulers
+        elif len(dirty):
+            transforms[dirty] = create_model_transforms(positions[dirty], eulers[dirty])
+            computed[dirty, 0:3] = positions[dirty]
+            computed[dirty, 3:6] = eulers[dirty]
+
+        return transforms
+
+    def snapshot(self) -> None:
+        """ Remember every entity's state, as a simulation tick begins. """
+
+        count = len(self.entities)
+        self.previous[:count, 0:3] = self.positions[:count]
+        self.previous[:count, 3:6] = self.eulers[:count]
+
+    def blend(self, rows: slice = slice(None)) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Return the positions and eulers of the given rows as they're
+            drawn, alpha of the way from the last snapshot to now.
+            Eulers turn the short way round, and entities made since the
+            snapshot are drawn where they are.
+        """
+
+        positions, eulers = self.positions[rows], self.eulers[rows]
+        if self.alpha >= 1.0:
+            return positions, eulers
+
+        previous = self.previous[rows]
+        known = ~np.isnan(previous[:, 0])
+        if not np.any(known):
+            return positions, eulers
+
+        turned = (eulers - previous[:, 3:6] + 180) % 360 - 180
+        positions = np.where(known[:, None],
+            previous[:, 0:3] + self.alpha * (positions - previous[:, 0:3]), positions)
+        eulers = np.where(known[:, None],
+            previous[:, 3:6] + self.alpha * turned, eulers)
+        return positions.astype(np.float32), eulers.astype(np.float32)
+
 class Entity:
     """ Represents a general object with a position and rotation applied"""
 
 
     def __init__(
         self, position: list[float], 
-        eulers: list[float], objectType: int):
+        eulers: list[float], objectType: int,
+        store: TransformStore | None = None):
         """
             Initialize the entity, store its state and update its transform.
 
@@ -189,11 +2030,46 @@ class Entity:
                 objectType: The type of object which the entity represents,
                             this should match a named constant.
 
+                store: where the entity's state is kept, shared by the
+                        entities of its type in a scene (see Scene.store),
+                        a store of its own if None.
+
         """
 
-        self.position = np.array(position, dtype=np.float32)
-        self.eulers = np.array(eulers, dtype=np.float32)
         self.objectType = objectType
+        self.store = store if store is not None else TransformStore()
+        self.row = self.store.add(self)
+
+        self.position = position
+        self.eulers = eulers
+
+    #position, eulers and tint are views onto the entity's row
+    #of its store, so editing them in place edits the store
+
+    @property
+    def position(self) -> np.ndarray:
+        return self.store.positions[self.row]
+
+    @position.setter
+    def position(self, position: list[float]) -> None:
+        self.store.positions[self.row] = position
+
+    @property
+    def eulers(self) -> np.ndarray:
+        return self.store.eulers[self.row]
+
+    @eulers.setter
+    def eulers(self, eulers: list[float]) -> None:
+        self.store.eulers[self.row] = eulers
+
+    @property
+    def tint(self) -> np.ndarray:
+        """ multiplies the colour of the entity's material """
+        return self.store.tints[self.row]
+
+    @tint.setter
+    def tint(self, tint: list[float]) -> None:
+        self.store.tints[self.row] = tint
     
     def get_model_transform(self) -> np.ndarray:
         """
@@ -201,20 +2077,17 @@ class Entity:
             based on its position and rotation.
         """
 
-        model_transform = pyrr.matrix44.create_identity(dtype=np.float32)
-        model_transform = pyrr.matrix44.multiply(
-                m1=model_transform, 
-                m2=pyrr.matrix44.create_from_eulers(
-                    eulers=np.radians(self.eulers), dtype=np.float32
-                )
-            )
-        model_transform = pyrr.matrix44.multiply(
-                m1=model_transform, 
-                m2=pyrr.matrix44.create_from_translation(
-                    vec=np.array(self.position),dtype=np.float32
-                )
-            )
-        return model_transform
+        return self.store.update_transforms(slice(self.row, self.row + 1))[0]
+
+    def get_shown_position(self) -> np.ndarray:
+        """ Where the entity is drawn, between the last two simulation ticks. """
+
+        return self.store.blend(slice(self.row, self.row + 1))[0][0]
+
+    def destroy(self) -> None:
+        """ Give the entity's row of its store back. """
+
+        self.store.remove(self)
 
     def update(self, rate: float) -> None:
 
@@ -223,8 +2096,9 @@ class Entity:
 class Pyramid(Entity):
 
 
-    def __init__(self, position, eulers, theta = 0, phi = 0):
-        super().__init__(position=position, eulers=eulers,objectType=OBJECT_PYRAMID)
+    def __init__(self, position, eulers, theta = 0, phi = 0,
+        store: TransformStore | None = None):
+        super().__init__(position=position, eulers=eulers,objectType=OBJECT_PYRAMID, store=store)
         
         
         self.theta = theta
@@ -264,10 +2138,15 @@ class Light:
 
 class Player(Entity):
 
-    def __init__(self, position, eulers=[0,0,0]):
-        super().__init__(position, eulers, OBJECT_CAMERA)
+    def __init__(self, position, eulers=[0,0,0], store: TransformStore | None = None):
+        super().__init__(position, eulers, OBJECT_CAMERA, store)
         self.theta = 0
         self.phi = 0
+        #the eulers the basis vectors, and the position the view
+        #transform, were last calculated from, nan forces a recalculation
+        self.vector_eulers = np.full(3, np.nan, dtype=np.float32)
+        self.view_position = np.full(3, np.nan, dtype=np.float32)
+        self.view_transform = np.identity(4, dtype=np.float32)
         #self.forwards = np.array([0,0,0], dtype=np.float32)
         self.update_vectors()
         self.localUp = np.array([0,0,1], dtype=np.float32)
@@ -291,46 +2170,390 @@ class Player(Entity):
 
         self.up = np.cross(self.right, self.forwards)
 
-    def calculate_vectors(self) -> None:
+        #the basis no longer follows the eulers, nor the view the basis
+        self.vector_eulers[:] = np.nan
+        self.view_position[:] = np.nan
+
+    def calculate_vectors(self, eulers: np.ndarray | None = None) -> None:
         """ 
-            Calculate the camera's fundamental vectors.
+            Calculate the camera's fundamental vectors, from the given
+            eulers or by default the camera's own.
 
             There are various ways to do this, this function
             achieves it by using cross products to produce
             an orthonormal basis.
         """
 
+        if eulers is None:
+            eulers = self.eulers
+
         #calculate the forwards vector directly using spherical coordinates
         self.forwards = np.array(
             [
-                np.cos(np.radians(self.eulers[2])) * np.cos(np.radians(self.eulers[1])),
-                np.sin(np.radians(self.eulers[2])) * np.cos(np.radians(self.eulers[1])),
-                np.sin(np.radians(self.eulers[1]))
+                np.cos(np.radians(eulers[2])) * np.cos(np.radians(eulers[1])),
+                np.sin(np.radians(eulers[2])) * np.cos(np.radians(eulers[1])),
+                np.sin(np.radians(eulers[1]))
             ],
             dtype=np.float32
         )
         self.right = pyrr.vector.normalise(np.cross(self.forwards, self.localUp))
         self.up = pyrr.vector.normalise(np.cross(self.right, self.forwards))
 
+        self.vector_eulers[:] = eulers
+        self.view_position[:] = np.nan
+
 
     def update(self):
-        self.calculate_vectors()
+        #only turning the camera changes its basis,
+        #which faces between the way it did on the last two ticks
+        eulers = self.store.blend(slice(self.row, self.row + 1))[1][0]
+        if np.array_equal(eulers, self.vector_eulers):
+            TRANSFORM_COUNTERS.hits += 1
+        else:
+            TRANSFORM_COUNTERS.recomputed += 1
+            self.calculate_vectors(eulers)
     
     def get_view_transform(self) -> np.ndarray:
-        """ Return's the camera's view transform. """
+        """
+            Return's the camera's view transform, which is only
+            recalculated if the camera moved or turned since the last call.
+            It looks from between where the camera was on the last two
+            simulation ticks, along the vectors made by update.
+        """
+
+        position = self.get_shown_position()
+        if np.array_equal(position, self.view_position):
+            TRANSFORM_COUNTERS.hits += 1
+            return self.view_transform
 
-        return pyrr.matrix44.create_look_at(
-            eye = self.position,
-            target = self.position + self.forwards,
+        TRANSFORM_COUNTERS.recomputed += 1
+        self.view_transform = pyrr.matrix44.create_look_at(
+            eye = position,
+            target = position + self.forwards,
             up = self.up,
             dtype = np.float32
         )
+        self.view_position[:] = position
+        return self.view_transform
+
+class SpatialIndex:
+    """
+        A bounding volume hierarchy over the world space boxes of the
+        scene's entities, for ray casts, range and nearest queries and
+        as the broadphase of frustum culling.
+
+        The boxes are gathered every update. If the same entities are
+        indexed as before, the tree is only refitted around their new
+        boxes, it's rebuilt when entities come or go, or when refitting
+        has made the boxes too loose. Entities coming and going are
+        noticed from each object type's list (which one it is, and its
+        length) and the generation of its store, without walking the
+        lists. Anything else which changes who is in the lists, like
+        swapping one entity for another, has to go through Scene.add
+        and Scene.remove, or call invalidate.
+
+        The nodes are kept in arrays, parents before their children,
+        and queries walk the tree a level at a time, testing every node
+        on the level at once.
+    """
+
+
+    def __init__(self, leaf_size: int = INDEX_LEAF_SIZE):
+
+        self.leaf_size = leaf_size
+        self.entities: list[Entity] = []
+        #object type and store row of each entity
+        self.types = np.zeros(0, dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.stores: dict[int, TransformStore] = {}
+        #what the entities were indexed from, see update
+        self.key: tuple | None = ()
+        #world space box of each entity
+        self.lower = np.zeros((0, 3), dtype=np.float32)
+        self.upper = np.zeros((0, 3), dtype=np.float32)
+        self.build()
+
+    def __len__(self) -> int:
+
+        return len(self.entities)
+
+    def invalidate(self) -> None:
+        """ Rebuild on the next update, whatever changed. """
+
+        self.key = None
+
+    def update(self, renderables: dict[int, list[Entity]],
+        bounds: dict[int, Bounds | None]) -> None:
+        """
+            Bring the index up to date with the given entities.
+
+            Parameters:
+
+                renderables: the entities to index, by object type
+
+                bounds: the model space bounds of each object type,
+                        types without any are indexed as points
+        """
+
+        key = tuple(
+            (objectType, id(group), len(group), id(group[0].store), group[0].store.generation)
+            for objectType, group in renderables.items() if group
+        )
+        rebuild = key != self.key
+        if rebuild:
+            self.key = key
+            entities = [entity for group in renderables.values() for entity in group]
+            self.entities = entities
+            self.types = np.repeat(
+                np.array(list(renderables.keys()), dtype=np.int64),
+                [len(group) for group in renderables.values()]
+            )
+            self.rows = np.array([entity.row for entity in entities], dtype=np.int64)
+            self.stores = {
+                objectType: group[0].store
+                for objectType, group in renderables.items() if group
+            }
+
+        lower = np.empty((len(self.entities), 3), dtype=np.float32)
+        upper = np.empty((len(self.entities), 3), dtype=np.float32)
+        for objectType, store in self.stores.items():
+            which = np.flatnonzero(self.types == objectType)
+            transforms = store.update_transforms()[self.rows[which]]
+            axes = transforms[:, 0:3, 0:3]
+            box = bounds.get(objectType)
+            if box is None:
+                center = transforms[:, 3, 0:3]
+                half_size = np.zeros_like(center)
+            else:
+                center = box.box_center @ axes + transforms[:, 3, 0:3]
+                half_size = box.half_size @ np.abs(axes)
+            lower[which] = center - half_size
+            upper[which] = center + half_size
+
+        if rebuild:
+            self.lower, self.upper = lower, upper
+            self.build()
+        elif not (np.array_equal(lower, self.lower) and np.array_equal(upper, self.upper)):
+            self.lower, self.upper = lower, upper
+            self.refit()
+            if self.surface_area() > INDEX_REBUILD_RATIO * self.built_area:
+                self.build()
+
+    def build(self) -> None:
+        """ Build the tree from scratch, splitting each node at its median. """
+
+        count = len(self.entities)
+        centers = (self.lower + self.upper) / 2
+        self.order = np.arange(count)
+
+        left, right, first, counts, depths = [], [], [], [], []
+        #first entity, entity count, depth, parent and which child of it
+        pending = [(0, count, 0, -1, None)]
+        while pending:
+            start, size, depth, parent, side = pending.pop()
+            node = len(first)
+            left.append(-1)
+            right.append(-1)
+            first.append(start)
+            counts.append(size)
+            depths.append(depth)
+            if parent >= 0:
+                side[parent] = node
+            if size <= self.leaf_size:
+                continue
+
+            #split the longest side of the box around the centers in half
+            members = self.order[start:start + size]
+            spread = centers[members].max(axis = 0) - centers[members].min(axis = 0)
+            axis = int(np.argmax(spread))
+            half = size // 2
+            split = np.argpartition(centers[members, axis], half)
+            self.order[start:start + size] = members[split]
+            pending.append((start + half, size - half, depth + 1, node, right))
+            pending.append((start, half, depth + 1, node, left))
+
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+        self.first = np.array(first, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.int64)
+        depths = np.array(depths, dtype=np.int64)
+
+        #inner nodes of each depth, for refitting from the bottom up
+        inner = self.left >= 0
+        self.levels = [
+            np.flatnonzero(inner & (depths == depth))
+            for depth in range(depths.max(initial = 0), -1, -1)
+        ]
+        self.leaves = np.flatnonzero(~inner & (self.counts > 0))
+
+        self.refit()
+        self.built_area = self.surface_area()
+
+    def refit(self) -> None:
+        """ Fit every node's box around its entities' current boxes. """
+
+        self.node_lower = np.zeros((len(self.first), 3), dtype=np.float32)
+        self.node_upper = np.zeros((len(self.first), 3), dtype=np.float32)
+        if len(self.leaves) == 0:
+            return
+
+        #leaves hold consecutive runs of the ordered entities
+        starts = self.first[self.leaves]
+        self.node_lower[self.leaves] = np.minimum.reduceat(self.lower[self.order], starts)
+        self.node_upper[self.leaves] = np.maximum.reduceat(self.upper[self.order], starts)
+        for nodes in self.levels:
+            self.node_lower[nodes] = np.minimum(
+                self.node_lower[self.left[nodes]], self.node_lower[self.right[nodes]])
+            self.node_upper[nodes] = np.maximum(
+                self.node_upper[self.left[nodes]], self.node_upper[self.right[nodes]])
+
+    def surface_area(self) -> float:
+        """ The total surface area of the nodes, it grows as the tree loosens. """
+
+        size = self.node_upper - self.node_lower
+        return float((size[:, 0] * size[:, 1] + size[:, 1] * size[:, 2]
+            + size[:, 2] * size[:, 0]).sum())
+
+    def search(self, test: Callable[[np.ndarray, np.ndarray], np.ndarray]) -> np.ndarray:
+        """
+            Return the indices of the entities whose boxes pass the test,
+            a function of (n, 3) lower and upper corners returning a mask.
+            Nodes which fail the test aren't looked into.
+        """
+
+        if len(self.entities) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        frontier = np.zeros(1, dtype=np.int64)
+        found = []
+        while len(frontier):
+            frontier = frontier[test(self.node_lower[frontier], self.node_upper[frontier])]
+            leaf = self.left[frontier] < 0
+            found.append(frontier[leaf])
+            inner = frontier[~leaf]
+            frontier = np.concatenate((self.left[inner], self.right[inner]))
+
+        #every entity of the leaves reached, then tested themselves
+        candidates = self.members(np.concatenate(found))
+        return candidates[test(self.lower[candidates], self.upper[candidates])]
+
+    def members(self, leaves: np.ndarray) -> np.ndarray:
+        """ Return the indices of every entity in the given leaves. """
+
+        sizes = self.counts[leaves]
+        offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        return self.order[np.repeat(self.first[leaves], sizes) + offsets]
+
+    def query_box(self, lower: np.ndarray, upper: np.ndarray) -> list[Entity]:
+        """ Return the entities whose boxes overlap the given box. """
+
+        hits = self.search(
+            lambda low, high: np.all((high >= lower) & (low <= upper), axis = 1))
+        return [self.entities[i] for i in hits]
+
+    def query_sphere(self, center: np.ndarray, radius: float) -> list[Entity]:
+        """ Return the entities whose boxes overlap the given sphere. """
+
+        center = np.asarray(center, dtype=np.float32)
+        hits = self.search(
+            lambda low, high: box_distance(low, high, center) <= radius)
+        return [self.entities[i] for i in hits]
+
+    def frustum_rows(self, planes: np.ndarray) -> dict[int, np.ndarray]:
+        """
+            Return, for every object type indexed, the store rows of
+            its entities whose boxes are at least partly inside the
+            given frustum planes (see frustum_planes).
+        """
+
+        normals, offsets = planes[:, 0:3], planes[:, 3]
+
+        def inside(low, high):
+            #the corner of each box furthest along each plane's normal
+            reach = np.where(normals > 0, high[:, None, :], low[:, None, :])
+            return np.all((reach * normals).sum(axis = 2) + offsets >= 0, axis = 1)
+
+        hits = self.search(inside)
+        return {
+            objectType: self.rows[hits[self.types[hits] == objectType]]
+            for objectType in self.stores
+        }
+
+    def raycast(self, origin: np.ndarray, direction: np.ndarray,
+        max_distance: float = np.inf) -> tuple[Entity, float] | None:
+        """
+            Return the entity whose box the ray hits first and how far
+            along the ray it is, or None if it hits nothing.
+        """
+
+        origin = np.asarray(origin, dtype=np.float64)
+        with np.errstate(divide = "ignore"):
+            inverse = 1 / np.asarray(direction, dtype=np.float64)
+
+        def entry(low, high):
+            with np.errstate(invalid = "ignore"):
+                near = (low - origin) * inverse
+                far = (high - origin) * inverse
+            #a ray along a face of the box gives nan, count it as inside
+            enter = np.nanmax(np.minimum(near, far), axis = 1, initial = 0)
+            leave = np.nanmin(np.maximum(near, far), axis = 1, initial = max_distance)
+            return np.where(enter <= leave, enter, np.inf)
+
+        hits = self.search(lambda low, high: entry(low, high) < np.inf)
+        if len(hits) == 0:
+            return None
+        distances = entry(self.lower[hits], self.upper[hits])
+        nearest = int(np.argmin(distances))
+        return self.entities[hits[nearest]], float(distances[nearest])
+
+    def nearest(self, point: np.ndarray, k: int = 1) -> list[Entity]:
+        """
+            Return the k entities nearest the point, by the distance to
+            their boxes, nearest first.
+        """
+
+        point = np.asarray(point, dtype=np.float32)
+        k = min(k, len(self.entities))
+        if k == 0:
+            return []
+
+        #the k nearest can't be further than the furthest corner
+        #of whichever nodes hold k entities between them
+        bound = np.inf
+        frontier = np.zeros(1, dtype=np.int64)
+        found = []
+        while len(frontier):
+            low, high = self.node_lower[frontier], self.node_upper[frontier]
+            furthest = np.sqrt((np.maximum(np.abs(point - low), np.abs(high - point)) ** 2).sum(axis = 1))
+            order = np.argsort(furthest)
+            enough = np.searchsorted(np.cumsum(self.counts[frontier][order]), k)
+            if enough < len(order):
+                bound = min(bound, furthest[order[enough]])
+
+            frontier = frontier[box_distance(low, high, point) <= bound]
+            leaf = self.left[frontier] < 0
+            found.append(frontier[leaf])
+            inner = frontier[~leaf]
+            frontier = np.concatenate((self.left[inner], self.right[inner]))
+
+        candidates = self.members(np.concatenate(found))
+        distances = box_distance(self.lower[candidates], self.upper[candidates], point)
+        nearest = candidates[np.argsort(distances, kind = "stable")[:k]]
+        return [self.entities[i] for i in nearest]
 
 class Scene:
 
     def __init__(self):
+        #the entities of each object type share a store, owned by the scene
+        #so its rows go with it
+        self.entity_stores: dict[int, TransformStore] = {}
         #create pyramid, camera, and lights
         self.create_scene_objects()
+
+        #where everything is, kept up to date as it's drawn
+        self.index = SpatialIndex()
+        #entity picked with the mouse
+        self.selected: Entity | None = None
         
         
 
@@ -341,13 +2564,15 @@ class Scene:
                 position = [0,0,0],
                 eulers = [0,0,0],
                 theta=90,
-                phi=0
+                phi=0,
+                store=self.store(OBJECT_PYRAMID)
             ),
         ]
 
         self.camera = Player(
             position = [0,-5,0],
-            eulers=[0,0,90]
+            eulers=[0,0,90],
+            store=self.store(OBJECT_CAMERA)
         )
         
         #rotate to face the triangle
@@ -429,6 +2654,47 @@ class Scene:
         
         self.camera.update()
 
+    def add(self, entity: Entity) -> None:
+        """ Put the entity in the scene, drawn with the others of its type. """
+
+        self.renderables.setdefault(entity.objectType, []).append(entity)
+        self.index.invalidate()
+
+    def remove(self, entity: Entity) -> None:
+        """ Take the entity out of the scene, giving its store row back. """
+
+        self.renderables[entity.objectType].remove(entity)
+        if self.selected is entity:
+            self.selected = None
+        entity.destroy()
+        self.index.invalidate()
+
+    def store(self, objectType: int) -> TransformStore:
+        """ The store shared by the scene's entities of the given type, pass it to new ones. """
+
+        if objectType not in self.entity_stores:
+            self.entity_stores[objectType] = TransformStore()
+        return self.entity_stores[objectType]
+
+    def stores(self) -> list[TransformStore]:
+        """ The transform stores of the scene's entities and camera. """
+
+        return list(self.entity_stores.values())
+
+    def snapshot(self) -> None:
+        """ Remember where everything is, as a simulation tick begins. """
+
+        for store in self.stores():
+            store.snapshot()
+
+    def interpolate(self, alpha: float) -> None:
+        """
+            Draw everything alpha (0 to 1) of the way from where it was
+            at the start of the last simulation tick to where it is now.
+        """
+
+        for store in self.stores():
+            store.alpha = alpha
 
     def move_camera(self, dPos):
 
@@ -451,6 +2717,15 @@ class Scene:
         self.camera.eulers[1] = min(89, max(-89, self.camera.eulers[1]))
 
     
+    def select(self, entity: Entity | None) -> None:
+        """ Highlight the given entity, instead of whichever was before. """
+
+        if self.selected is not None and self.selected.row >= 0:
+            self.selected.tint = [1, 1, 1, 1]
+        self.selected = entity
+        if entity is not None:
+            entity.tint = SELECTED_TINT
+
     def move_pyramid(self, dPos):
         dPos = np.array(dPos, dtype = np.float32)
         self.renderables[OBJECT_PYRAMID][0].position += dPos
@@ -497,26 +2772,112 @@ class Scene:
             if pyramid.eulers[2] > 360:
                 pyramid.eulers[2] -= 360
 
+    def steer(self, keys: int, dx: float, dy: float, tickTime: float) -> None:
+        """
+            Move the camera and the arrow for one simulation tick.
+
+            Parameters:
+
+                keys: the keys held, as the KEY_BITS of each or'ed together
+
+                dx, dy: how far the mouse moved since the last tick, in pixels
+
+                tickTime: how long a tick lasts, in ms
+        """
+
+        #USE SHIFT AND SPACE TO GO DOWN AND UP IN Z AXIS, RESPECTIVELy
+        camera_z = ((keys >> 5) & 1) - ((keys >> 4) & 1)
+        self.move_camera([0, 0, camera_z * 0.025 * 0.2])
+
+        #WASD walks the way the camera faces, turned by the combo's direction
+        direction = WALK_DIRECTIONS[keys & 15]
+        if not np.isnan(direction):
+            angle = np.deg2rad(self.camera.eulers[2] + direction)
+            self.move_camera([
+                tickTime * 0.025 * np.cos(angle),
+                tickTime * 0.025 * np.sin(angle),
+                0
+            ])
+
+        # NOW THE ARROW: up flies it forwards, left and right turn it
+        combo = (keys >> 6) & 7
+        if combo:
+            #if change theta is positive, it moves left, if it is negative, it moves right
+            changeTheta = -1 if combo & 4 else 1 if combo & 2 else 0
+            pyramid = self.renderables[OBJECT_PYRAMID][0]
+
+            if combo & 1:
+                theta = np.deg2rad(pyramid.theta)
+                self.move_pyramid([
+                    tickTime * 0.025 * np.cos(theta),
+                    tickTime * 0.025 * np.sin(theta),
+                    0
+                ])
+                #spin the arrow, as if it's rolling through the air
+                self.rolling_arrow(rate = 20 * tickTime / 16.67)
+
+            #if you press left and right, don't rotate
+            if combo != 6:
+                rate = 5 * tickTime / 16.67
+                self.spin_pyramid(-rate * changeTheta, 0)
+
+        #and the mouse turns the camera
+        if dx or dy:
+            self.spin_camera(np.array([0, -dy, -dx], dtype=np.float32))
+
+    def pick(self, origin: np.ndarray, direction: np.ndarray) -> None:
+        """ Select whatever the given ray hits first, or nothing. """
+
+        hit = self.index.raycast(origin, direction)
+        self.select(hit[0] if hit else None)
+
 class App:
 
 
-    def __init__(self, screenWidth, screenHeight):
+    def __init__(self, screenWidth, screenHeight, trace: str | None = None,
+        max_fps: float = 0, record: str | None = None, replay: str | None = None,
+        gpu_budget: int = GPU_MEMORY_BUDGET):
 
         #self.window = window
         
         self.screenWidth = screenWidth
         self.screenHeight = screenHeight
+        #where to write a Chrome trace of the last frames on quitting
+        self.trace = trace
+        #frames are drawn as fast as they can be if 0
+        self.max_fps = max_fps
+        #where to save every tick's input on quitting
+        self.record = record
+        self.recording: list[tuple[int, float, float, bool]] = []
+        #recorded input played back in place of the keyboard and mouse
+        self.replay = iter(load_input_recording(replay)) if replay else None
         
         self.set_up_glfw()
+        self.input = InputState(self.window)
+        STARTUP.mark("window")
 
-        self.renderer = GraphicsEngine(self.screenWidth, self.screenHeight, self.window)
+        self.renderer = GraphicsEngine(
+            self.screenWidth, self.screenHeight, self.window, gpu_budget)
+        STARTUP.mark("engine")
 
         self.scene = Scene()
+        STARTUP.mark("scene")
 
         self.lastTime = glfw.get_time()
         self.currentTime = 0
         self.numFrames = 0
+        #length of the last frame, and of every simulation tick, in ms
         self.frameTime = 0
+        self.tickTime = 1000 / TICK_RATE
+        #time the simulation still has to catch up on, in seconds
+        self.accumulator = 0.0
+        self.frameStart = time.perf_counter()
+        self.frameDeadline = self.frameStart
+        #transform cache hits and recalculations in the last frame
+        self.transformCounts = (0, 0)
+        #opengl state calls issued and skipped in the last frame
+        self.stateCounts = (0, 0)
+        self.cullCounts = (0, 0)
 
         self.mainLoop()
         
@@ -534,194 +2895,1060 @@ class App:
             GLFW_CONSTANTS.GLFW_OPENGL_FORWARD_COMPAT, 
             GLFW_CONSTANTS.GLFW_TRUE
         )
-        glfw.window_hint(GLFW_CONSTANTS.GLFW_DOUBLEBUFFER, False)
+        glfw.window_hint(GLFW_CONSTANTS.GLFW_DOUBLEBUFFER, True)
         self.window = glfw.create_window(
             self.screenWidth, self.screenHeight, "Title", None, None
         )
         glfw.make_context_current(self.window)
+        #frames are paced by max_fps, not by the display
+        glfw.swap_interval(0)
     
     def mainLoop(self):
         running = True
         while (running):
-            #check events
-            if glfw.window_should_close(self.window) \
-                or glfw.get_key(self.window, GLFW_CONSTANTS.GLFW_KEY_ESCAPE) == GLFW_CONSTANTS.GLFW_PRESS:
+            #check events, escape closes the window
+            if glfw.window_should_close(self.window):
                 running = False
             
-            self.handleKeys()
-            self.handleMouse()
-
+            PROFILER.begin_frame()
             glfw.poll_events()
 
-            self.scene.update(self.frameTime / 16.67)
-            
-            self.renderer.render(
-                camera = self.scene.camera,
-                renderables = self.scene.renderables,
-                lights = self.scene.lights
-            )
+            #step the simulation at a fixed rate, as many times
+            #as fit in the time since the last frame
+            now = time.perf_counter()
+            self.frameTime = 1000 * (now - self.frameStart)
+            self.frameStart = now
+            self.accumulator += min(self.frameTime / 1000, MAX_FRAME_TIME)
+            with PROFILER.cpu("simulate"):
+                while self.accumulator >= 1 / TICK_RATE:
+                    with PROFILER.cpu("input"):
+                        state = self.next_input()
+                        if state is not None:
+                            self.scene.snapshot()
+                            self.handleInput(state)
+                    if state is None:
+                        #the replay is over
+                        running = False
+                        break
+                    with PROFILER.cpu("scene.update"):
+                        self.scene.update(self.tickTime / 16.67)
+                    self.accumulator -= 1 / TICK_RATE
+
+            #and draw everything part of the way into the next tick
+            self.scene.interpolate(self.accumulator * TICK_RATE)
+            self.scene.camera.update()
+            with PROFILER.cpu("render"):
+                self.renderer.render(
+                    camera = self.scene.camera,
+                    renderables = self.scene.renderables,
+                    lights = self.scene.lights,
+                    index = self.scene.index
+                )
+            with PROFILER.cpu("swap"):
+                glfw.swap_buffers(self.window)
+            PROFILER.end_frame()
+            STARTUP.first_frame()
+            self.limit_frame_rate()
 
             #timing
+            self.transformCounts = TRANSFORM_COUNTERS.reset()
+            self.stateCounts = GL_STATE.reset_counts()
+            self.cullCounts = self.renderer.reset_cull_counts()
             self.calculateFramerate()
         self.quit()
 
-    def handleKeys(self):
-
-        combo = 0
-        directionModifier = 0
-        """
-        w: 1 -> 0 degrees
-        a: 2 -> 90 degrees
-        w & a: 3 -> 45 degrees
-        s: 4 -> 180 degrees
-        w & s: 5 -> x
-        a & s: 6 -> 135 degrees
-        w & a & s: 7 -> 90 degrees
-        d: 8 -> 270 degrees
-        w & d: 9 -> 315 degrees
-        a & d: 10 -> x
-        w & a & d: 11 -> 0 degrees
-        s & d: 12 -> 225 degrees
-        w & s & d: 13 -> 270 degrees
-        a & s & d: 14 -> 180 degrees
-        w & a & s & d: 15 -> x
-        """
-
-        if glfw.get_key(self.window, GLFW_CONSTANTS.GLFW_KEY_W) == GLFW_CONSTANTS.GLFW_PRESS:
-            combo += 1
-        if glfw.get_key(self.window, GLFW_CONSTANTS.GLFW_KEY_A) == GLFW_CONSTANTS.GLFW_PRESS:
-            combo += 2
-        if glfw.get_key(self.window, GLFW_CONSTANTS.GLFW_KEY_S) == GLFW_CONSTANTS.GLFW_PRESS:
-            combo += 4
-        if glfw.get_key(self.window, GLFW_CONSTANTS.GLFW_KEY_D) == GLFW_CONSTANTS.GLFW_PRESS:
-            combo += 8
-        
-        #USE SHIFT AND SPACE TO GO DOWN AND UP IN Z AXIS, RESPECTIVELy
-        #represents the change in the cameras vertical positon (z) axis
-        camera_z = 0
-        
-        if glfw.get_key(self.window, GLFW_CONSTANTS.GLFW_KEY_LEFT_SHIFT) == GLFW_CONSTANTS.GLFW_PRESS:
-            camera_z += -1
-        
-        if glfw.get_key(self.window, GLFW_CONSTANTS.GLFW_KEY_SPACE) == GLFW_CONSTANTS.GLFW_PRESS:
-            camera_z += 1
-        
-        dPos = [
-                0,
-                0,
-                camera_z * 0.025 * 0.2
-        ]
-        self.scene.move_camera(dPos)
+    def next_input(self) -> tuple[int, float, float, bool] | None:
+        """
+            Return the input for the next simulation tick, from the replay
+            if there is one (None once it's over), otherwise from the
+            keyboard and mouse, keeping it if the input is being recorded.
+        """
+
+        if self.replay is not None:
+            state = next(self.replay, None)
+        else:
+            state = self.input.tick()
+        if state is not None and self.record is not None:
+            self.recording.append(state)
+        return state
+
+    def handleInput(self, state: tuple[int, float, float, bool]) -> None:
+
+        keys, dx, dy, click = state
+        self.scene.steer(keys, dx, dy, self.tickTime)
+
+        #left click picks whatever is in the middle of the screen
+        if click:
+            self.scene.pick(*self.renderer.cursor_ray(self.screenWidth / 2, self.screenHeight / 2))
+
+    def calculateFramerate(self):
+
+        self.currentTime = glfw.get_time()
+        delta = self.currentTime - self.lastTime
+        if (delta >= 1):
+            framerate = max(1,int(self.numFrames/delta))
+            hits, recomputed = self.transformCounts
+            issued, skipped = self.stateCounts
+            visible, culled = self.cullCounts
+            p50, p95, p99 = PROFILER.percentiles("frame")
+            gpuMemory = self.renderer.gpuMemory
+            glfw.set_window_title(
+                self.window,
+                f"Running at {framerate} fps. "
+                f"Frame p50/p95/p99: {p50:.1f}/{p95:.1f}/{p99:.1f} ms. "
+                f"Transforms: {hits} cached, {recomputed} recalculated. "
+                f"GL state calls: {issued} issued, {skipped} skipped. "
+                f"Instances: {visible} visible, {culled} culled. "
+                f"GPU memory: {gpuMemory.used() / 2**20:.1f}/{gpuMemory.budget / 2**20:.0f} MB."
+            )
+            self.lastTime = self.currentTime
+            self.numFrames = -1
+        self.numFrames += 1
 
+    def limit_frame_rate(self) -> None:
+        """ With a frame rate cap, wait until the next frame is due. """
+
+        if self.max_fps <= 0:
+            return
+
+        self.frameDeadline += 1 / self.max_fps
+        now = time.perf_counter()
+        if self.frameDeadline < now:
+            #fell behind, don't rush the next frames to make up for it
+            self.frameDeadline = now
+        sleep_until(self.frameDeadline)
+
+    def quit(self):
         
-        if (combo > 0):
-            if combo == 3:
-                directionModifier = 45
-            elif combo == 2 or combo == 7:
-                directionModifier = 90
-            elif combo == 6:
-                directionModifier = 135
-            elif combo == 4 or combo == 14:
-                directionModifier = 180
-            elif combo == 12:
-                directionModifier = 225
-            elif combo == 8 or combo == 13:
-                directionModifier = 270
-            elif combo == 9:
-                directionModifier = 315
-            
-            dPos = [
-                self.frameTime * 0.025 * np.cos(np.deg2rad(self.scene.camera.eulers[2]  + directionModifier)),
-                self.frameTime * 0.025 * np.sin(np.deg2rad(self.scene.camera.eulers[2]  + directionModifier)),
+        if self.record is not None:
+            save_input_recording(self.record, self.recording)
+        if self.trace is not None:
+            PROFILER.export_trace(self.trace)
+        PROFILER.destroy()
+        self.renderer.destroy()
+
+class InputState:
+    """
+        The keyboard and mouse, followed through glfw callbacks as their
+        events arrive rather than polled, and handed out a simulation tick
+        at a time: the keys held (as KEY_BITS), how far the mouse moved
+        and whether the left button was clicked since the last tick.
+
+        The cursor is captured, so the mouse turns the camera however
+        far it moves.
+    """
+
+
+    def __init__(self, window):
+
+        self.keys = 0
+        #glfw key code to bit
+        self.key_bits = {
+            getattr(GLFW_CONSTANTS, "GLFW_KEY_" + name): bit
+            for name, bit in KEY_BITS.items()
+        }
+        self.dx = 0.0
+        self.dy = 0.0
+        self.clicked = False
+
+        glfw.set_input_mode(window, GLFW_CONSTANTS.GLFW_CURSOR, GLFW_CONSTANTS.GLFW_CURSOR_DISABLED)
+        self.cursor = glfw.get_cursor_pos(window)
+        glfw.set_key_callback(window, self.on_key)
+        glfw.set_cursor_pos_callback(window, self.on_cursor)
+        glfw.set_mouse_button_callback(window, self.on_mouse_button)
+
+    def on_key(self, window, key: int, scancode: int, action: int, mods: int) -> None:
+
+        if key == GLFW_CONSTANTS.GLFW_KEY_ESCAPE and action == GLFW_CONSTANTS.GLFW_PRESS:
+            glfw.set_window_should_close(window, True)
+        if action == GLFW_CONSTANTS.GLFW_PRESS:
+            self.keys |= self.key_bits.get(key, 0)
+        elif action == GLFW_CONSTANTS.GLFW_RELEASE:
+            self.keys &= ~self.key_bits.get(key, 0)
+
+    def on_cursor(self, window, x: float, y: float) -> None:
+
+        self.dx += x - self.cursor[0]
+        self.dy += y - self.cursor[1]
+        self.cursor = (x, y)
+
+    def on_mouse_button(self, window, button: int, action: int, mods: int) -> None:
+
+        if button == GLFW_CONSTANTS.GLFW_MOUSE_BUTTON_LEFT and action == GLFW_CONSTANTS.GLFW_PRESS:
+            self.clicked = True
+
+    def tick(self) -> tuple[int, float, float, bool]:
+        """ Return the input for a tick, using up the mouse movement and click. """
+
+        state = (self.keys, self.dx, self.dy, self.clicked)
+        self.dx = self.dy = 0.0
+        self.clicked = False
+        return state
+
+def save_input_recording(filename: str,
+    ticks: list[tuple[int, float, float, bool]]) -> None:
+    """ Write the input of every tick, as given by InputState.tick, to the file. """
+
+    with open(filename, "wb") as f:
+        f.write(INPUT_MAGIC + struct.pack("<I", TICK_RATE))
+        f.write(np.array(ticks, dtype=INPUT_RECORD).tobytes())
+
+def load_input_recording(filename: str) -> list[tuple[int, float, float, bool]]:
+    """
+        Read the input of every tick back from a file written by
+        save_input_recording. It has to have been recorded at the
+        same tick rate to play back the same way.
+    """
+
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    header = len(INPUT_MAGIC) + 4
+    if not data.startswith(INPUT_MAGIC) or (len(data) - header) % INPUT_RECORD.itemsize:
+        raise ValueError(f"{filename} is not an input recording")
+    (tick_rate,) = struct.unpack_from("<I", data, len(INPUT_MAGIC))
+    if tick_rate != TICK_RATE:
+        raise ValueError(f"{filename} was recorded at {tick_rate} ticks a second, not {TICK_RATE}")
+
+    ticks = np.frombuffer(data, dtype=INPUT_RECORD, offset = header)
+    return [(keys, dx, dy, bool(click)) for keys, dx, dy, click in ticks.tolist()]
+
+def replay_script(ticks: list[tuple[int, float, float, bool]]) -> Callable[[HeadlessApp, int], None]:
+    """ A headless script which plays back recorded input, a tick per frame. """
+
+    def step(app: HeadlessApp, frame: int) -> None:
+        if frame >= len(ticks):
+            return
+        keys, dx, dy, click = ticks[frame]
+        app.scene.steer(keys, dx, dy, 1000 / TICK_RATE)
+        if click:
+            app.scene.pick(*app.renderer.cursor_ray(app.screenWidth / 2, app.screenHeight / 2))
+
+    return step
+
+def sleep_until(deadline: float) -> None:
+    """
+        Sleep until time.perf_counter() reaches the deadline.
+
+        time.sleep can overshoot by a millisecond or more, so it sleeps
+        until SLEEP_MARGIN before the deadline, then gives its time
+        slice away in short naps rather than spinning for the rest.
+    """
+
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return
+        if remaining > SLEEP_MARGIN:
+            time.sleep(remaining - SLEEP_MARGIN)
+        else:
+            time.sleep(0)
+
+class OffscreenContext:
+    """
+        An OpenGL 3.3 core context without a window, made through EGL
+        (or OSMesa if PYOPENGL_PLATFORM is "osmesa"), drawing into a
+        framebuffer object of the given size. Software rendering
+        (llvmpipe) is fine, so it runs on machines without a GPU.
+    """
+
+
+    def __init__(self, width: int, height: int):
+
+        self.width = width
+        self.height = height
+        if os.environ.get("PYOPENGL_PLATFORM") == "osmesa":
+            self.create_osmesa_context()
+        else:
+            self.create_egl_context()
+
+        #color and depth, everything is drawn into these
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        self.colorBuffer, self.depthBuffer = glGenRenderbuffers(2)
+        for renderbuffer, storage, attachment in (
+            (self.colorBuffer, GL_RGBA8, GL_COLOR_ATTACHMENT0),
+            (self.depthBuffer, GL_DEPTH24_STENCIL8, GL_DEPTH_STENCIL_ATTACHMENT)):
+            glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+            glRenderbufferStorage(GL_RENDERBUFFER, storage, width, height)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, renderbuffer)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("offscreen framebuffer is incomplete")
+
+    def create_egl_context(self) -> None:
+        """ Make a surfaceless EGL context current. """
+
+        from OpenGL import EGL
+
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("couldn't initialise EGL")
+
+        config = EGL.EGLConfig()
+        config_count = EGL.EGLint()
+        EGL.eglChooseConfig(
+            self.display,
+            (EGL.EGLint * 5)(
+                EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                #the default asks for windows, which headless displays don't have
+                EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                EGL.EGL_NONE
+            ),
+            ctypes.pointer(config), 1, ctypes.pointer(config_count)
+        )
+        if config_count.value == 0:
+            raise RuntimeError("EGL has no desktop OpenGL config")
+
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(
+            self.display, config, EGL.EGL_NO_CONTEXT,
+            (EGL.EGLint * 7)(
+                EGL.EGL_CONTEXT_MAJOR_VERSION, 3,
+                EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+                EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+                EGL.EGL_NONE
+            )
+        )
+        if not self.context:
+            raise RuntimeError("couldn't create an OpenGL 3.3 core context")
+        #no surface at all, the framebuffer object is drawn into instead
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.context)
+
+    def create_osmesa_context(self) -> None:
+        """ Make an OSMesa context current, drawing into host memory. """
+
+        from OpenGL import osmesa
+
+        self.context = osmesa.OSMesaCreateContextAttribs(
+            [
+                osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+                osmesa.OSMESA_DEPTH_BITS, 24,
+                osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+                osmesa.OSMESA_CONTEXT_MAJOR_VERSION, 3,
+                osmesa.OSMESA_CONTEXT_MINOR_VERSION, 3,
                 0
-            ]
+            ], None
+        )
+        if not self.context:
+            raise RuntimeError("couldn't create an OpenGL 3.3 core context")
+        #osmesa needs a buffer of its own, even though nothing is drawn to it
+        self.hostBuffer = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        osmesa.OSMesaMakeCurrent(self.context, self.hostBuffer, GL_UNSIGNED_BYTE, self.width, self.height)
+
+    def read_pixels(self) -> np.ndarray:
+        """ Return what was drawn, as (height, width, 4) RGBA rows from the top. """
+
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo)
+        pixels = glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE)
+        return np.frombuffer(pixels, dtype=np.uint8).reshape(self.height, self.width, 4)[::-1]
+
+    def destroy(self) -> None:
+
+        glDeleteRenderbuffers(2, (self.colorBuffer, self.depthBuffer))
+        glDeleteFramebuffers(1, (self.fbo,))
+        if os.environ.get("PYOPENGL_PLATFORM") == "osmesa":
+            from OpenGL import osmesa
+            osmesa.OSMesaDestroyContext(self.context)
+        else:
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroyContext(self.display, self.context)
+            EGL.eglTerminate(self.display)
+
+def demo_script(app: HeadlessApp, frame: int) -> None:
+    """
+        What a headless run does by default each frame, in place of
+        the keyboard and mouse: look around slowly and fly the arrow
+        forwards, rolling it as it goes.
+    """
+
+    app.scene.spin_camera(np.array([0, 0, 0.5], dtype=np.float32))
+    app.scene.move_pyramid([0.01, 0, 0])
+    app.scene.rolling_arrow(rate = 1)
+
+class HeadlessApp:
+    """
+        Runs the game without a window or input: a fixed number of
+        frames into an offscreen framebuffer, each one driven by a
+        script, timing Scene.update and GraphicsEngine.render.
+
+        A script is a function (app, frame) called before every frame,
+        see demo_script. The last frame can be saved as an image, and
+        the timings as a Chrome trace.
+    """
+
+
+    def __init__(self, screenWidth: int, screenHeight: int, frames: int,
+        script: Callable[[HeadlessApp, int], None] = demo_script,
+        output: str | None = None, trace: str | None = None,
+        gpu_budget: int = GPU_MEMORY_BUDGET):
+
+        self.screenWidth = screenWidth
+        self.screenHeight = screenHeight
+        self.context = OffscreenContext(screenWidth, screenHeight)
+        STARTUP.mark("context")
+        self.renderer = GraphicsEngine(self.screenWidth, self.screenHeight, None, gpu_budget)
+        STARTUP.mark("engine")
+        self.scene = Scene()
+        STARTUP.mark("scene")
+
+        self.run(frames, script)
+        if output is not None:
+            from PIL import Image
+            Image.fromarray(self.context.read_pixels()).save(output)
+        if trace is not None:
+            PROFILER.export_trace(trace)
+        PROFILER.collect_gpu_times(wait = True)
+        PROFILER.report()
+        self.renderer.gpuMemory.report()
+        self.quit()
+
+    def run(self, frames: int, script: Callable[[HeadlessApp, int], None]) -> None:
+
+        for frame in range(frames):
+            PROFILER.begin_frame()
+            script(self, frame)
+
+            with PROFILER.cpu("scene.update"):
+                #a simulation tick per frame
+                self.scene.update(1000 / TICK_RATE / 16.67)
+
+            with PROFILER.cpu("render"):
+                self.renderer.render(
+                    camera = self.scene.camera,
+                    renderables = self.scene.renderables,
+                    lights = self.scene.lights,
+                    index = self.scene.index
+                )
+                #wait for the frame to actually be drawn
+                glFinish()
+            PROFILER.end_frame()
+            STARTUP.first_frame()
+
+    def quit(self) -> None:
+
+        PROFILER.destroy()
+        self.renderer.destroy()
+        self.context.destroy()
+
+class GLState:
+    """
+        Remembers the OpenGL state set through it: the program, vertex
+        array, texture bound to each unit, enabled capabilities and
+        blend and depth functions, and skips any call which would set
+        what is already set. Each call through PyOpenGL is a costly
+        round trip, so state should only ever be changed through here.
+
+        Counts the calls it issued and skipped since the last reset.
+    """
+
+
+    def __init__(self):
+
+        #what a new context starts with
+        self.program = 0
+        self.vao = 0
+        self.active_unit = 0
+        #texture bound to each (unit, target)
+        self.textures: dict[tuple[int, int], int] = {}
+        self.capabilities: dict[int, bool] = {}
+        self.blend = None
+        self.depth = None
+
+        self.issued = 0
+        self.skipped = 0
+
+    def changes(self, current: Any, wanted: Any) -> bool:
+        """ Count a call, returning whether it would change anything. """
+
+        if current == wanted:
+            self.skipped += 1
+            return False
+        self.issued += 1
+        return True
+
+    def use_program(self, program: int) -> None:
+
+        if self.changes(self.program, program):
+            glUseProgram(program)
+            self.program = program
+
+    def bind_vertex_array(self, vao: int) -> None:
+
+        if self.changes(self.vao, vao):
+            glBindVertexArray(vao)
+            self.vao = vao
+
+    def active_texture(self, unit: int) -> None:
+
+        if self.changes(self.active_unit, unit):
+            glActiveTexture(GL_TEXTURE0 + unit)
+            self.active_unit = unit
+
+    def bind_texture(self, target: int, texture: int, unit: int | None = None) -> None:
+        """ Bind the texture to the given unit, by default the active one. """
+
+        if unit is not None:
+            self.active_texture(unit)
+        key = (self.active_unit, target)
+        if self.changes(self.textures.get(key), texture):
+            glBindTexture(target, texture)
+            self.textures[key] = texture
+
+    def enable(self, capability: int) -> None:
+
+        if self.changes(self.capabilities.get(capability), True):
+            glEnable(capability)
+            self.capabilities[capability] = True
+
+    def disable(self, capability: int) -> None:
+
+        if self.changes(self.capabilities.get(capability), False):
+            glDisable(capability)
+            self.capabilities[capability] = False
+
+    def blend_func(self, source: int, destination: int) -> None:
+
+        if self.changes(self.blend, (source, destination)):
+            glBlendFunc(source, destination)
+            self.blend = (source, destination)
+
+    def depth_func(self, function: int) -> None:
+
+        if self.changes(self.depth, function):
+            glDepthFunc(function)
+            self.depth = function
+
+    def forget(self, program: int | None = None, vao: int | None = None,
+        texture: int | None = None) -> None:
+        """
+            Forget the given objects as they're deleted, OpenGL unbinds
+            them, and a later object may be given the same name.
+        """
+
+        if program is not None and self.program == program:
+            self.program = 0
+        if vao is not None and self.vao == vao:
+            self.vao = 0
+        if texture is not None:
+            for key, bound in list(self.textures.items()):
+                if bound == texture:
+                    self.textures[key] = 0
+
+    def reset_counts(self) -> tuple[int, int]:
+        """ Return the calls issued and skipped so far and start again. """
+
+        counts = (self.issued, self.skipped)
+        self.issued = 0
+        self.skipped = 0
+        return counts
+
+#every state change goes through this, there's only one context
+GL_STATE = GLState()
+
+class FrameProfiler:
+    """
+        Times scopes of each frame, on the CPU with perf_counter and on
+        the GPU with GL_TIME_ELAPSED queries, keeping the last
+        PROFILE_HISTORY frames in a ring buffer.
+
+        GPU results are only read once the query says they're
+        available, a frame or more later, so timing never stalls the
+        pipeline; their queries are then reused. GPU scopes can't
+        be nested inside each other, CPU scopes can.
+
+        Timings can be summarised as percentiles, or exported as a
+        Chrome trace (chrome://tracing, ui.perfetto.dev).
+    """
+
+
+    def __init__(self, history: int = PROFILE_HISTORY):
+
+        self.history = history
+        self.enabled = True
+        self.frame = -1
+        self.frameStart = 0.0
+        #trace timestamps count from here
+        self.origin = time.perf_counter()
+        #milliseconds of each scope in each frame's slot, nan if it didn't run
+        self.timings: dict[str, np.ndarray] = {}
+        #trace events of each frame's slot
+        self.events: list[list[dict[str, Any]]] = [[] for _ in range(history)]
+        self.freeQueries: list[int] = []
+        #query, frame, scope name and when it started on the CPU
+        self.pending: list[tuple[int, int, str, float]] = []
+
+    def begin_frame(self) -> None:
+        """ Start timing a new frame, collecting any GPU times which are ready. """
+
+        if not self.enabled:
+            return
+        self.collect_gpu_times()
+        self.frame += 1
+        slot = self.frame % self.history
+        for timings in self.timings.values():
+            timings[slot] = np.nan
+        self.events[slot] = []
+        self.frameStart = time.perf_counter()
+
+    def end_frame(self) -> None:
+
+        if self.enabled and self.frame >= 0:
+            self.record("frame", "CPU", self.frame, self.frameStart,
+                time.perf_counter() - self.frameStart)
+
+    @contextmanager
+    def cpu(self, name: str) -> Iterator[None]:
+        """ Time the body of a with statement on the CPU. """
+
+        if not self.enabled or self.frame < 0:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, "CPU", self.frame, start, time.perf_counter() - start)
+
+    @contextmanager
+    def gpu(self, name: str) -> Iterator[None]:
+        """ Time the GPU work of the OpenGL calls made in a with statement. """
+
+        if not self.enabled or self.frame < 0:
+            yield
+            return
+        query = self.freeQueries.pop() if self.freeQueries else int(glGenQueries(1)[0])
+        start = time.perf_counter()
+        glBeginQuery(GL_TIME_ELAPSED, query)
+        try:
+            yield
+        finally:
+            glEndQuery(GL_TIME_ELAPSED)
+            self.pending.append((query, self.frame, name, start))
+
+    def collect_gpu_times(self, wait: bool = False) -> None:
+        """ Record the results of the GPU queries which have finished. """
+
+        available = ctypes.c_int()
+        elapsed = ctypes.c_uint64()
+        pending = []
+        for query, frame, name, start in self.pending:
+            if not wait:
+                glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE, ctypes.byref(available))
+                if not available.value:
+                    pending.append((query, frame, name, start))
+                    continue
+            glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(elapsed))
+            self.record(name, "GPU", frame, start, elapsed.value / 1e9)
+            self.freeQueries.append(query)
+        self.pending = pending
+
+    def record(self, name: str, track: str, frame: int, start: float, seconds: float) -> None:
+
+        if frame <= self.frame - self.history:
+            #its slot has been reused already
+            return
+        slot = frame % self.history
+        key = name if track == "CPU" else f"gpu:{name}"
+        if key not in self.timings:
+            self.timings[key] = np.full(self.history, np.nan)
+        #scopes which run more than once a frame add up
+        self.timings[key][slot] = np.nan_to_num(self.timings[key][slot]) + seconds * 1000
+        self.events[slot].append({
+            "name": name, "ph": "X", "pid": 1, "tid": 1 if track == "CPU" else 2,
+            "ts": (start - self.origin) * 1e6, "dur": seconds * 1e6,
+            "args": {"frame": frame}
+        })
+
+    def percentiles(self, key: str) -> tuple[float, float, float]:
+        """ The p50, p95 and p99 of a scope over the frames kept, in milliseconds. """
+
+        timings = self.timings.get(key)
+        if timings is None or np.all(np.isnan(timings)):
+            return (np.nan, np.nan, np.nan)
+        return tuple(np.nanpercentile(timings, (50, 95, 99)).tolist())
+
+    def report(self) -> None:
+        """ Print the percentiles of every scope. """
+
+        print(f"{'scope':<22}{'frames':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for key, timings in self.timings.items():
+            p50, p95, p99 = self.percentiles(key)
+            print(f"{key:<22}{np.count_nonzero(~np.isnan(timings)):>8}"
+                  f"{p50:>10.3f}{p95:>10.3f}{p99:>10.3f}")
+
+    def export_trace(self, filename: str) -> None:
+        """ Write the frames kept as a Chrome trace event JSON file. """
+
+        self.collect_gpu_times(wait = True)
+        first = max(self.frame - self.history + 1, 0)
+        events = [
+            event for frame in range(first, self.frame + 1)
+            for event in self.events[frame % self.history]
+        ]
+        threads = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+            for tid, name in ((1, "CPU"), (2, "GPU"))
+        ]
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": threads + events, "displayTimeUnit": "ms"}, f)
+
+    def destroy(self) -> None:
+
+        queries = self.freeQueries + [query for query, *_ in self.pending]
+        if queries:
+            glDeleteQueries(len(queries), queries)
+        self.freeQueries = []
+        self.pending = []
+
+#shared by the app and the graphics engine
+PROFILER = FrameProfiler()
+
+class StartupTimer:
+    """
+        Times starting up, from this file being loaded until the first
+        frame is shown, in phases which each run from the end of the
+        one before. The time to the first frame is printed once, and
+        flagged if it's over FIRST_FRAME_BUDGET.
+    """
+
+
+    def __init__(self, start: float):
+
+        self.start = start
+        self.last = start
+        self.phases: list[tuple[str, float]] = []
+        self.shown = False
+
+    def mark(self, phase: str) -> None:
+        """ End the given phase now. """
+
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def first_frame(self) -> None:
+        """ Mark the first frame as shown and report, does nothing after that. """
+
+        if self.shown:
+            return
+        self.shown = True
+        self.mark("first frame")
+
+        total = self.last - self.start
+        phases = ", ".join(f"{phase} {seconds * 1000:.1f}" for phase, seconds in self.phases)
+        print(f"first frame after {total * 1000:.1f} ms ({phases})")
+        if total > FIRST_FRAME_BUDGET:
+            print(f"over the {FIRST_FRAME_BUDGET * 1000:.0f} ms budget for the first frame")
+
+STARTUP = StartupTimer(LAUNCH_TIME)
+
+def has_extension(name: str) -> bool:
+    """ Return whether the current context supports the named extension. """
+
+    count = glGetIntegerv(GL_NUM_EXTENSIONS)
+    return any(glGetStringi(GL_EXTENSIONS, i).decode() == name for i in range(count))
+
+def map_buffer(target: int, size: int, flags: int) -> np.ndarray:
+    """ Map the first size bytes of the buffer bound to target, as a uint8 array. """
+
+    address = glMapBufferRange(target, 0, size, flags)
+    return np.ctypeslib.as_array((ctypes.c_ubyte * size).from_address(address))
+
+def wait_for_fence(fence) -> None:
+    """ Block until the gpu has passed the fence. """
+
+    if glClientWaitSync(fence, 0, 0) == GL_ALREADY_SIGNALED:
+        return
+    with PROFILER.cpu("stream.wait"):
+        while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, FENCE_TIMEOUT) == GL_TIMEOUT_EXPIRED:
+            pass
+
+class StreamBuffer:
+    """
+        Data written every frame (or whenever it changes), streamed
+        through a ring of STREAM_SEGMENTS buffers. Each frame's data
+        goes into the next buffer of the ring while the gpu may still be
+        drawing from the others, and a fence after the frame's draws
+        says when the gpu is done with it, so the cpu only has to wait
+        if it gets a whole ring ahead.
+
+        Writes go straight into the mapped buffer through numpy views.
+        With GL 4.4 (or ARB_buffer_storage) each buffer is mapped once,
+        persistently, otherwise it's mapped while it's written, without
+        synchronising, as the fence has already been waited for.
+    """
+
+
+    def __init__(self, target: int, capacity: int = STREAM_CAPACITY,
+        segments: int = STREAM_SEGMENTS):
+
+        self.target = target
+        self.persistent = has_extension("GL_ARB_buffer_storage")
+        self.buffers = [int(buffer) for buffer in np.atleast_1d(glGenBuffers(segments))]
+        self.capacities = [0] * segments
+        #mapped memory of each buffer, None while it isn't mapped
+        self.views: list[np.ndarray | None] = [None] * segments
+        #passed once the gpu is done with each buffer
+        self.fences: list[Any] = [None] * segments
+        self.current = 0
+        self.offset = 0
+
+        for segment in range(segments):
+            self.allocate(segment, capacity)
+
+    @property
+    def buffer(self) -> int:
+        """ The buffer being written, and drawn from, this frame. """
+
+        return self.buffers[self.current]
+
+    def allocate(self, segment: int, capacity: int) -> None:
+        """ Give the ring's given buffer room for capacity bytes. """
+
+        flags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        if self.persistent and self.views[segment] is not None:
+            #immutable storage can't be resized, so the buffer is replaced
+            glDeleteBuffers(1, (self.buffers[segment],))
+            self.buffers[segment] = int(glGenBuffers(1))
+            self.views[segment] = None
+
+        glBindBuffer(self.target, self.buffers[segment])
+        if self.persistent:
+            glBufferStorage(self.target, capacity, None, flags)
+            self.views[segment] = map_buffer(self.target, capacity, flags)
+        else:
+            glBufferData(self.target, capacity, None, GL_STREAM_DRAW)
+        self.capacities[segment] = capacity
+
+    def begin(self, size: int) -> None:
+        """
+            Move on to the next buffer of the ring, with room for size
+            bytes, once the gpu has finished drawing from it.
+        """
+
+        self.current = (self.current + 1) % len(self.buffers)
+        self.offset = 0
+
+        fence = self.fences[self.current]
+        if fence is not None:
+            wait_for_fence(fence)
+            glDeleteSync(fence)
+            self.fences[self.current] = None
+
+        capacity = self.capacities[self.current]
+        if size > capacity:
+            while capacity < size:
+                capacity *= 2
+            self.allocate(self.current, capacity)
+
+        if not self.persistent and size:
+            glBindBuffer(self.target, self.buffer)
+            self.views[self.current] = map_buffer(
+                self.target, size,
+                GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT | GL_MAP_UNSYNCHRONIZED_BIT
+            )
+
+    def reserve(self, size: int) -> tuple[int, np.ndarray]:
+        """
+            Take the next size bytes of this frame's buffer.
+
+            Returns:
+
+                Their offset in the buffer, and the uint8 array to write them through.
+        """
+
+        offset = self.offset
+        self.offset = offset + -(-size // STREAM_ALIGNMENT) * STREAM_ALIGNMENT
+        return offset, self.views[self.current][offset:offset + size]
+
+    def write(self, array: np.ndarray) -> int:
+        """ Copy the array into this frame's buffer, returning its offset. """
+
+        offset, view = self.reserve(array.nbytes)
+        view[:] = np.ascontiguousarray(array).view(np.uint8).ravel()
+        return offset
+
+    def end(self) -> None:
+        """ Finish writing this frame's buffer, before anything draws from it. """
+
+        if not self.persistent and self.views[self.current] is not None:
+            glBindBuffer(self.target, self.buffer)
+            glUnmapBuffer(self.target)
+            self.views[self.current] = None
+
+    def fence(self) -> None:
+        """ Mark this frame's draws, the buffer in use is free once they're done. """
+
+        if self.fences[self.current] is not None:
+            glDeleteSync(self.fences[self.current])
+        self.fences[self.current] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def destroy(self) -> None:
+
+        for fence in self.fences:
+            if fence is not None:
+                glDeleteSync(fence)
+        #deleting a buffer unmaps it
+        glDeleteBuffers(len(self.buffers), self.buffers)
+
+class UniformBuffer:
+    """
+        The buffer behind a std140 uniform block, bound to a binding
+        point so every program with the block shares it. Its contents
+        are only sent when they differ from what was sent last.
+    """
+
+
+    def __init__(self, binding: int, floats: int):
+
+        self.data = np.zeros(floats, dtype=np.float32)
+        #what the buffer holds now, nan until the first upload
+        self.uploaded = np.full(floats, np.nan, dtype=np.float32)
+
+        self.ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, self.data.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBufferBase(GL_UNIFORM_BUFFER, binding, self.ubo)
+
+    def upload(self) -> bool:
+        """
+            Send self.data with a single glBufferSubData if it changed,
+            returning whether it did.
+        """
+
+        if np.array_equal(self.data, self.uploaded):
+            return False
+
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.data.nbytes, self.data)
+        self.uploaded[:] = self.data
+        return True
+
+    def destroy(self) -> None:
+
+        glDeleteBuffers(1, (self.ubo,))
+
+class TextureBuffer:
+    """
+        A buffer read in shaders as a buffer texture (samplerBuffer),
+        for arrays too big or too changeable for a uniform block.
+        Each upload is streamed into the next buffer of a ring, which
+        the texture is then pointed at.
+    """
+
+
+    def __init__(self, internal_format: int):
+
+        self.internal_format = internal_format
+        self.stream = StreamBuffer(GL_TEXTURE_BUFFER)
+        self.texture = glGenTextures(1)
+        GL_STATE.bind_texture(GL_TEXTURE_BUFFER, self.texture)
+        glTexBuffer(GL_TEXTURE_BUFFER, internal_format, self.stream.buffer)
+
+    def upload(self, array: np.ndarray) -> None:
+        """ Replace the contents with the given array. """
+
+        self.stream.begin(array.nbytes)
+        if array.nbytes:
+            self.stream.write(array)
+        self.stream.end()
+
+        GL_STATE.bind_texture(GL_TEXTURE_BUFFER, self.texture)
+        glTexBuffer(GL_TEXTURE_BUFFER, self.internal_format, self.stream.buffer)
+
+    def use(self, unit: int) -> None:
+
+        GL_STATE.bind_texture(GL_TEXTURE_BUFFER, self.texture, unit)
+
+    def fence(self) -> None:
+        """ Mark this frame's draws, which read the buffer. """
+
+        self.stream.fence()
+
+    def destroy(self) -> None:
+
+        glDeleteTextures(1, (self.texture,))
+        GL_STATE.forget(texture = self.texture)
+        self.stream.destroy()
+
+class LightClusters:
+    """
+        Clustered forward lighting: every frame the lights are sorted
+        into clusters of the view frustum (see cluster_lights), so each
+        fragment only lights itself with the lights of its own cluster,
+        however many lights there are in total.
+    """
+
+
+    def __init__(self):
+
+        #two texels per light: position, radius then color, strength
+        self.lightData = TextureBuffer(GL_RGBA32F)
+        #offset and count of each cluster's lights in the index list
+        self.clusterData = TextureBuffer(GL_RG32UI)
+        self.lightIndices = TextureBuffer(GL_R32UI)
+        #what the clusters were last built from
+        self.packed = np.zeros((0, 8), dtype=np.float32)
+
+    def update(self, lights: list[Light], view: np.ndarray,
+        projection: np.ndarray, camera_moved: bool) -> None:
+        """
+            Rebuild the clusters if the lights or camera changed,
+            then bind the buffers to their texture units.
+        """
 
-            self.scene.move_camera(dPos)
-        
-        # NOW HANDLE KEYS FOR ARROW
-        combo = 0
-        directionModifier = 0
-        
-        #if change theta is positive, it moves left, if it is negative, it moves right
-        changeTheta = 0
-        
-        if glfw.get_key(self.window, GLFW_CONSTANTS.GLFW_KEY_UP) == GLFW_CONSTANTS.GLFW_PRESS:
-            combo += 1
-        if glfw.get_key(self.window, GLFW_CONSTANTS.GLFW_KEY_LEFT) == GLFW_CONSTANTS.GLFW_PRESS:
-            combo += 2
-            changeTheta = 1
-        if glfw.get_key(self.window, GLFW_CONSTANTS.GLFW_KEY_RIGHT) == GLFW_CONSTANTS.GLFW_PRESS:
-            combo += 4
-            changeTheta = -1
-        
-        if combo > 0:
-            #we need to check if W is pressed, so we actually move forward
-            # so check if you are just pressing left and right
-            if (combo != 2 and combo != 4 and combo != 6):
-                # Now move the pyramid forward
-                dPos = [
-                    self.frameTime * 0.025 * np.cos(np.deg2rad(self.scene.renderables[OBJECT_PYRAMID][0].theta + directionModifier)),
-                    self.frameTime * 0.025 * np.sin(np.deg2rad(self.scene.renderables[OBJECT_PYRAMID][0].theta + directionModifier)),
-                    0
-                ]
+        packed = np.zeros((len(lights), 8), dtype=np.float32)
+        for i, light in enumerate(lights):
+            packed[i, 0:3] = light.position
+            packed[i, 4:7] = light.color
+            packed[i, 7] = light.strength
+        #as far as the light is brighter than the cutoff
+        packed[:, 3] = np.sqrt(packed[:, 7] * packed[:, 4:7].max(axis = 1, initial = 0) / LIGHT_CUTOFF)
 
-                self.scene.move_pyramid(dPos)
-                
-                #ROTATE PYRAMID AROUND Y axis, as if arrow is spinning through the air
-                #spin the arrow function
-                rate = 20 * self.frameTime / 16.67
-                self.scene.rolling_arrow(rate=rate)
-            
-            #HANDLES ROTATION
-            #if you press left and right, don't rotate
-            if (combo != 6):
-                #Add rotation
-                rate = 5 * self.frameTime / 16.67
-                theta_reversal = -1
-                theta_increment = theta_reversal * rate * changeTheta
-                #no change in the pitch yet
-                phi_increment = 0
-                
-                self.scene.spin_pyramid(theta_increment, phi_increment)
-        
-    def handleMouse(self):
+        lights_changed = not np.array_equal(packed, self.packed)
+        if lights_changed:
+            self.lightData.upload(packed)
+            self.packed = packed
+        if lights_changed or camera_moved:
+            ranges, indices = cluster_lights(packed[:, 0:3], packed[:, 3], view, projection)
+            self.clusterData.upload(ranges)
+            self.lightIndices.upload(indices)
 
-        (x,y) = glfw.get_cursor_pos(self.window)
-        rate = self.frameTime / 16.67
-        theta_increment = rate * ((self.screenWidth / 2) - x)
-        phi_increment = rate * ((self.screenHeight / 2) - y)
-        dEulers = np.array([0, phi_increment, theta_increment], dtype=np.float32)
-        self.scene.spin_camera(dEulers)
-        glfw.set_cursor_pos(self.window, self.screenWidth / 2, self.screenHeight / 2)
+        self.lightData.use(LIGHT_DATA_UNIT)
+        self.clusterData.use(CLUSTER_DATA_UNIT)
+        self.lightIndices.use(LIGHT_INDEX_UNIT)
 
-    def calculateFramerate(self):
+    def fence(self) -> None:
+        """ Mark this frame's draws, which read the buffers. """
 
-        self.currentTime = glfw.get_time()
-        delta = self.currentTime - self.lastTime
-        if (delta >= 1):
-            framerate = max(1,int(self.numFrames/delta))
-            glfw.set_window_title(self.window, f"Running at {framerate} fps.")
-            self.lastTime = self.currentTime
-            self.numFrames = -1
-            self.frameTime = float(1000.0 / max(1,framerate))
-        self.numFrames += 1
+        for buffer in (self.lightData, self.clusterData, self.lightIndices):
+            buffer.fence()
 
-    def quit(self):
-        
-        self.renderer.destroy()
+    def destroy(self) -> None:
+
+        for buffer in (self.lightData, self.clusterData, self.lightIndices):
+            buffer.destroy()
 
 class GraphicsEngine:
     
     
     def __init__(self, screenWidth: int, screenHeight: int,
-        window):
+        window, gpuBudget: int = GPU_MEMORY_BUDGET):
         
         self.screenWidth = screenWidth
         self.screenHeight = screenHeight
+        #meshes and textures are evicted past this many bytes
+        self.gpuMemory = GPUMemoryBudget(gpuBudget)
         
         self.set_up_opengl(window=window)
         self.make_assets()
 
+        #instances drawn and culled, since the counts were last reset
+        self.visible_count = 0
+        self.culled_count = 0
+
         #initialise opengl
         glClearColor(0.0, 0.0, 0.0, 1)
         
@@ -737,14 +3964,19 @@ class GraphicsEngine:
 
         glClearColor(0.0, 0.0, 0.0, 1)
 
-        (w,h) = glfw.get_framebuffer_size(window)
+        #without a window, the framebuffer is the size of the screen
+        if window is None:
+            (w,h) = (self.screenWidth, self.screenHeight)
+        else:
+            (w,h) = glfw.get_framebuffer_size(window)
         glViewport(0,0,w, h)
+        self.framebufferSize = (w, h)
 
-        glEnable(GL_DEPTH_TEST)
-        glDepthFunc(GL_LESS)
+        GL_STATE.enable(GL_DEPTH_TEST)
+        GL_STATE.depth_func(GL_LESS)
 
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        GL_STATE.enable(GL_BLEND)
+        GL_STATE.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
     
     def make_assets(self):
         '''We create our 
@@ -753,164 +3985,434 @@ class GraphicsEngine:
         shaders
         
         '''
-        self.meshes: dict[int, Mesh] = {
-            OBJECT_PYRAMID: PyramidMesh(),
-            OBJECT_SKY: Quad2D(
+        #images and models are decoded in the background,
+        #placeholders are drawn until they are uploaded
+        self.loader = AssetLoader()
+        self.placeholder = None
+
+        #each mesh and material is only made once something is drawn with it
+        self.meshes = AssetTable({
+            OBJECT_PYRAMID: PyramidMesh,
+            OBJECT_SKY: lambda: Quad2D(
                 center = (0,0),
                 size = (1,1)
             )
-        }
-        
-        self.materials: dict[int, Material] = {
-            OBJECT_PYRAMID: Material2D("gfx/marble.jpeg"),
-            OBJECT_SKY: MaterialCubemap("gfx/spacesky/sky"),
-            
-        }
+        })
+
+        self.materials = AssetTable({
+            OBJECT_PYRAMID: lambda: SurfaceMaterial(Material2D("gfx/marble.jpeg", self.loader)),
+            OBJECT_SKY: lambda: MaterialCubemap(SKY_TEXTURE, self.loader),
+
+        })
+
+        #materials of obj models, from their mtl files
+        self.material_library = MaterialLibrary(self.loader)
+
+        #transforms of every entity drawn of each object type,
+        #by object type and level of detail, streamed every frame
+        self.instance_buffers: dict[tuple[int, int], InstanceBuffer] = {}
+        self.instanceStream = StreamBuffer(GL_ARRAY_BUFFER)
         
         self.shaders: dict[int, int] = {
-            PIPELINE_SKY: createShader(
-                "shaders/vertex_sky.txt", 
-                "shaders/fragment_sky.txt"
-            ),
-            PIPELINE_3D: createShader(
-                "shaders/vertex.txt", 
-                "shaders/fragment.txt"
-            )
+            pipeline: createShader(*sources)
+            for pipeline, sources in SHADER_SOURCES.items()
         }
         
-        # store struct of light as a position
-        
-        self.lightLocation = {
-            "position": [
-                glGetUniformLocation(self.shaders[PIPELINE_3D], f"Lights[{i}].position")
-                for i in range(8)
-            ],
-            "color": [
-                glGetUniformLocation(self.shaders[PIPELINE_3D], f"Lights[{i}].color")
-                for i in range(8)
-            ],
-            "strength": [
-                glGetUniformLocation(self.shaders[PIPELINE_3D], f"Lights[{i}].strength")
-                for i in range(8)
-            ],
+        #the camera is shared by the programs through a uniform block,
+        #the lights go through buffer textures, sorted into clusters
+        self.cameraBlock = UniformBuffer(UNIFORM_BINDING_CAMERA, CAMERA_BLOCK_FLOATS)
+        self.lightClusters = LightClusters()
+
+        self.materialLocation = {
+            "diffuse": glGetUniformLocation(self.shaders[PIPELINE_3D], "diffuseColor"),
+            "specular": glGetUniformLocation(self.shaders[PIPELINE_3D], "specularColor"),
+            "shininess": glGetUniformLocation(self.shaders[PIPELINE_3D], "shininess"),
         }
         
 
     def get_uniform_locations(self):
-        # get the required uniforms for the sky pipeline
-        glUseProgram(self.shaders[PIPELINE_SKY])
-        self.cameraForwardsLocation = glGetUniformLocation(
-            self.shaders[PIPELINE_SKY], "forwards"
-        )
-        self.cameraRightLocation = glGetUniformLocation(
-            self.shaders[PIPELINE_SKY], "right"
-        )
-        self.cameraUpLocation = glGetUniformLocation(
-            self.shaders[PIPELINE_SKY], "up"
-        )
-                
-        glUseProgram(self.shaders[PIPELINE_3D])
-        
-        self.modelMatrixLocation = glGetUniformLocation(self.shaders[PIPELINE_3D], "model")
-        self.viewMatrixLocation = glGetUniformLocation(self.shaders[PIPELINE_3D], "view")
-        
-        #get camera position location for specular component
-        self.cameraPosLocation = glGetUniformLocation(self.shaders[PIPELINE_3D], "cameraPosition")
-        
-        self.projectionMatrixLocation = glGetUniformLocation(self.shaders[PIPELINE_3D],"projection")
+        # point every program's uniform blocks at the shared buffers
+        for shader in self.shaders.values():
+            for name, binding in (
+                ("Camera", UNIFORM_BINDING_CAMERA),):
+
+                index = glGetUniformBlockIndex(shader, name)
+                if index != GL_INVALID_INDEX:
+                    glUniformBlockBinding(shader, index, binding)
 
     def set_onetime_uniforms(self):
         # SET BACKGROUND UNIFORMS
-        glUseProgram(self.shaders[PIPELINE_3D])
                 
-        #set projection uniform
+        #set projection, it's part of the camera block
 
-        projection_transform = pyrr.matrix44.create_perspective_projection(
+        self.cameraBlock.data[16:32] = pyrr.matrix44.create_perspective_projection(
             fovy = 45, aspect = 640/480, 
-            near = 0.1, far = 100, dtype=np.float32
-        )
-        glUniformMatrix4fv(
-            self.projectionMatrixLocation,
-            1, GL_FALSE, projection_transform
-        )
+            near = NEAR_PLANE, far = FAR_PLANE, dtype=np.float32
+        ).ravel()
         
         # pass in image texture of the arrow to the arrow's shader
+        GL_STATE.use_program(self.shaders[PIPELINE_3D])
         glUniform1i(
             glGetUniformLocation(self.shaders[PIPELINE_3D], "imageTexture"), 1)
         glUniform1i(
             glGetUniformLocation(self.shaders[PIPELINE_3D], "skyTexture"), 0)
+
+        #clustered lights
+        for name, unit in (
+            ("lightData", LIGHT_DATA_UNIT),
+            ("clusterData", CLUSTER_DATA_UNIT),
+            ("lightIndices", LIGHT_INDEX_UNIT)):
+            glUniform1i(glGetUniformLocation(self.shaders[PIPELINE_3D], name), unit)
+        glUniform3i(glGetUniformLocation(self.shaders[PIPELINE_3D], "clusterGrid"), *CLUSTER_GRID)
+        glUniform2f(glGetUniformLocation(self.shaders[PIPELINE_3D], "screenSize"), *self.framebufferSize)
+        glUniform1f(glGetUniformLocation(self.shaders[PIPELINE_3D], "zNear"), NEAR_PLANE)
+        glUniform1f(glGetUniformLocation(self.shaders[PIPELINE_3D], "zFar"), FAR_PLANE)
         
         #the sky needs the SKY TEXTURE == 0
-        glUseProgram(self.shaders[PIPELINE_SKY])
+        GL_STATE.use_program(self.shaders[PIPELINE_SKY])
         glUniform1i(
             glGetUniformLocation(self.shaders[PIPELINE_SKY], "imageTextureCube"), 0)
-    
+        #the sky's up vector is scaled to the screen's shape
+        glUniform1f(
+            glGetUniformLocation(self.shaders[PIPELINE_SKY], "aspectCorrection"),
+            self.screenHeight / self.screenWidth
+        )
 
-    def render_objects(self, renderables):
-        for pyramid in renderables[OBJECT_PYRAMID]:
+    def update_uniform_blocks(self, camera: Player, lights: list[Light]) -> None:
+        """
+            Pack the camera into its uniform block and the lights into
+            their clusters, each is only uploaded if it changed.
+        """
 
-            glUniformMatrix4fv(self.modelMatrixLocation,1,GL_FALSE,pyramid.get_model_transform())
-            self.materials[OBJECT_PYRAMID].use()
-            
-            #draw triangle
-            glBindVertexArray(self.meshes[OBJECT_PYRAMID].vao)
-            glDrawArrays(GL_TRIANGLES, 0, self.meshes[OBJECT_PYRAMID].vertex_count)
+        camera_data = self.cameraBlock.data
+        camera_data[0:16] = camera.get_view_transform().ravel()
+        camera_data[32:35] = camera.get_shown_position()
+        camera_data[36:39] = camera.forwards
+        camera_data[40:43] = camera.right
+        camera_data[44:47] = camera.up
+        camera_moved = self.cameraBlock.upload()
+
+        self.lightClusters.update(
+            lights, camera_data[0:16].reshape(4, 4),
+            camera_data[16:32].reshape(4, 4), camera_moved
+        )
+    
 
-            glFlush()
+    def render_objects(self, renderables, planes: np.ndarray,
+        broadphase: dict[int, np.ndarray] | None = None):
+
+        #gather every submesh to draw by material,
+        #so each material is bound once however many use it
+        batches: dict[SurfaceMaterial, list[tuple[Mesh, Submesh, InstanceBuffer]]] = {}
+        uploads: list[tuple[InstanceBuffer, np.ndarray, np.ndarray]] = []
+        for objectType, entities in renderables.items():
+
+            mesh = self.meshes.get(objectType)
+            if mesh is None or not entities:
+                continue
+            self.gpuMemory.reference(objectType, mesh)
+            #an evicted mesh keeps its bounds, and is culled with them
+            if not mesh.ready and mesh.resident:
+                mesh = self.placeholder_mesh
+
+            #every entity of the type is an instance of its mesh
+            store = entities[0].store
+            transforms = store.update_transforms()
+            tints = store.tints[:len(store)]
+            rows = None
+            if len(entities) != len(store):
+                #only some of the store's entities are to be drawn
+                rows = np.array([entity.row for entity in entities])
+            if broadphase is not None and objectType in broadphase \
+                and mesh.bounds is not None:
+                #those the spatial index finds in view
+                rows = broadphase[objectType] if rows is None \
+                    else np.intersect1d(rows, broadphase[objectType])
+            if rows is None:
+                rows = np.arange(len(store))
+            else:
+                transforms, tints = transforms[rows], tints[rows]
+
+            #and only those the camera can see
+            if mesh.bounds is not None:
+                visible = cull_instances(planes, transforms, mesh.bounds)
+                if not visible.all():
+                    transforms, tints, rows = transforms[visible], tints[visible], rows[visible]
+            self.visible_count += len(transforms)
+            self.culled_count += len(entities) - len(transforms)
+            if len(transforms) == 0:
+                continue
+            #some are drawn, so an evicted mesh is loaded again
+            self.gpuMemory.use(mesh)
+            if not mesh.ready:
+                mesh = self.placeholder_mesh
+                self.gpuMemory.use(mesh)
+
+            #each at the level of detail its size on screen calls for
+            levels = np.zeros(len(rows), dtype=np.int32)
+            if len(mesh.lods) > 1 and mesh.bounds is not None:
+                levels = pick_lod_levels(
+                    self.screen_sizes(transforms, mesh.bounds), store.levels[rows], len(mesh.lods))
+                store.levels[rows] = levels
+
+            for level in np.unique(levels).tolist():
+                if (objectType, level) not in self.instance_buffers:
+                    self.instance_buffers[(objectType, level)] = InstanceBuffer()
+                instances = self.instance_buffers[(objectType, level)]
+                if len(mesh.lods) > 1:
+                    at_level = levels == level
+                    uploads.append((instances, transforms[at_level], tints[at_level]))
+                else:
+                    uploads.append((instances, transforms, tints))
+
+                for submesh in mesh.lods[level]:
+                    material = self.material_library.get(mesh.libraries, submesh.material) \
+                        or self.materials[objectType]
+                    self.gpuMemory.reference(objectType, material.texture)
+                    self.gpuMemory.use(material.texture)
+                    batches.setdefault(material, []).append((mesh, submesh, instances))
+
+        #every instance goes into the next buffer of the stream
+        self.instanceStream.begin(sum(
+            len(transforms) * INSTANCE_FLOATS * 4 for _, transforms, _ in uploads))
+        for instances, transforms, tints in uploads:
+            instances.write(self.instanceStream, transforms, tints)
+        self.instanceStream.end()
+
+        #which instances each mesh's attributes point at, this frame
+        attached: dict[Mesh, InstanceBuffer] = {}
+        for material, draws in batches.items():
+
+            material.use(self.materialLocation)
+            for mesh, submesh, instances in draws:
+
+                if attached.get(mesh) is not instances:
+                    instances.attach(mesh)
+                    attached[mesh] = instances
+                
+                #draw triangle
+                GL_STATE.bind_vertex_array(mesh.vao)
+                if mesh.index_count:
+                    glDrawElementsInstanced(
+                        GL_TRIANGLES, submesh.count, GL_UNSIGNED_INT,
+                        ctypes.c_void_p(4 * submesh.first), instances.count
+                    )
+                else:
+                    glDrawArraysInstanced(
+                        GL_TRIANGLES, submesh.first, submesh.count, instances.count
+                    )
     
     def render_background_sky(self, camera: Player):
         #push sky onto the screen
-        # PUSHING VECTORS OF CAMERA INTO SHADER
-        glUseProgram(self.shaders[PIPELINE_SKY])
-        glDisable(GL_DEPTH_TEST)
+        # the camera's vectors come from the camera block
+        GL_STATE.use_program(self.shaders[PIPELINE_SKY])
+        GL_STATE.disable(GL_DEPTH_TEST)
+        for asset in (self.meshes[OBJECT_SKY], self.materials[OBJECT_SKY]):
+            self.gpuMemory.reference(OBJECT_SKY, asset)
+            self.gpuMemory.use(asset)
         self.materials[OBJECT_SKY].use()
-        glUniform3fv(self.cameraForwardsLocation, 1, camera.forwards)
-        glUniform3fv(self.cameraRightLocation, 1, camera.right)
-        correction_factor = self.screenHeight / self.screenWidth
-        glUniform3fv(self.cameraUpLocation, 1, correction_factor * camera.up)
         
         #take points of sky, and the material (Its texture) and push the array buffer to the vertexes
-        glBindVertexArray(self.meshes[OBJECT_SKY].vao)
+        GL_STATE.bind_vertex_array(self.meshes[OBJECT_SKY].vao)
         glDrawArrays(GL_TRIANGLES, 0, self.meshes[OBJECT_SKY].vertex_count)
 
     def render(self, camera: Player, 
         renderables: dict[int, list[Entity]],
-        lights: list[Light]) -> None:
+        lights: list[Light], index: SpatialIndex | None = None) -> None:
+
+        #swap in any assets which finished loading
+        with PROFILER.cpu("render.uploads"):
+            self.loader.process_uploads()
+        #the entities using each object type's assets
+        self.gpuMemory.count({
+            objectType: len(entities) for objectType, entities in renderables.items()
+        })
 
         #refresh screen
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        #camera and lights, for every program
+        with PROFILER.cpu("render.uniforms"):
+            self.update_uniform_blocks(camera, lights)
         
         #render the background sky
-        self.render_background_sky(camera=camera)
+        with PROFILER.cpu("render.sky"), PROFILER.gpu("sky"):
+            self.render_background_sky(camera=camera)
         
         #RE ENABLE DEPTH TEST, RENDERING OBJECTS NOW
-        glEnable(GL_DEPTH_TEST)
-        glUseProgram(self.shaders[PIPELINE_3D])
-        
-        # CREATE VIEW TRANSFORM FROM CAMERA
-        glUniformMatrix4fv(self.viewMatrixLocation, 1, GL_FALSE, camera.get_view_transform())
-        glUniform3fv(self.cameraPosLocation, 1, camera.position)
+        GL_STATE.enable(GL_DEPTH_TEST)
+        GL_STATE.use_program(self.shaders[PIPELINE_3D])
         
+        planes = frustum_planes(
+            self.cameraBlock.data[0:16].reshape(4, 4),
+            self.cameraBlock.data[16:32].reshape(4, 4)
+        )
+        #the spatial index, if there is one, narrows down what to cull
+        broadphase = None
+        if index is not None:
+            with PROFILER.cpu("render.index"):
+                index.update(renderables, self.mesh_bounds(renderables))
+                broadphase = index.frustum_rows(planes)
+        with PROFILER.cpu("render.objects"), PROFILER.gpu("objects"):
+            self.render_objects(renderables, planes, broadphase)
+
+        #the streamed buffers are free again once the gpu gets this far
+        self.instanceStream.fence()
+        self.lightClusters.fence()
+
+        #past the budget, evict what hasn't been drawn for longest
+        with PROFILER.cpu("render.evict"):
+            self.gpuMemory.end_frame()
         
-        #update lighting information, we only have 1 light right now
-        for i, light in enumerate(lights):
+    def screen_sizes(self, transforms: np.ndarray, bounds: Bounds) -> np.ndarray:
+        """
+            Return roughly how tall (in pixels) each instance of a mesh
+            is on screen, from its bounding sphere.
+        """
 
-            glUniform3fv(self.lightLocation["position"][i], 1, light.position)
-            glUniform3fv(self.lightLocation["color"][i], 1, light.color)
-            glUniform1f(self.lightLocation["strength"][i], light.strength)
-        
+        axes = transforms[:, 0:3, 0:3]
+        centers = bounds.center @ axes + transforms[:, 3, 0:3]
+        radii = bounds.radius * np.sqrt((axes * axes).sum(axis = 2).max(axis = 1))
+        distances = np.maximum(
+            np.linalg.norm(centers - self.cameraBlock.data[32:35], axis = 1), NEAR_PLANE)
+
+        #the projection's y scale takes a height at unit distance to clip space
+        return radii / distances * self.cameraBlock.data[16 + 5] * self.framebufferSize[1]
+
+    def load_assets(self, objectTypes: Iterable[int]) -> None:
+        """
+            Make the meshes and materials of the given object types now,
+            rather than when they're first drawn. Those loading in the
+            background still need the loader to finish.
+        """
+
+        for objectType in objectTypes:
+            self.meshes.get(objectType)
+            self.materials.get(objectType)
+
+    @property
+    def placeholder_mesh(self) -> ObjMesh:
+        """ The mesh drawn in place of those still loading, made when first needed. """
+
+        if self.placeholder is None:
+            self.placeholder = ObjMesh(PLACEHOLDER_MODEL)
+        return self.placeholder
+
+    def mesh_bounds(self, objectTypes: Iterable[int]) -> dict[int, Bounds | None]:
+        """ The bounds of the mesh of each of the given object types, as it's drawn now. """
+
+        bounds = {}
+        for objectType in objectTypes:
+            mesh = self.meshes.get(objectType)
+            if mesh is not None:
+                #evicted meshes keep their bounds
+                bounds[objectType] = mesh.bounds if mesh.ready or not mesh.resident \
+                    else self.placeholder_mesh.bounds
+        return bounds
+
+    def cursor_ray(self, x: float, y: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Return the origin and direction of the ray from the camera
+            through the given point of the window, in pixels.
+        """
+
+        view = self.cameraBlock.data[0:16].reshape(4, 4)
+        projection = self.cameraBlock.data[16:32].reshape(4, 4)
+        unproject = np.linalg.inv(view.astype(np.float64) @ projection)
+
+        #the point on the near and far planes, back in world space
+        ndc_x = 2 * x / self.screenWidth - 1
+        ndc_y = 1 - 2 * y / self.screenHeight
+        ends = np.array([[ndc_x, ndc_y, -1, 1], [ndc_x, ndc_y, 1, 1]]) @ unproject
+        near, far = ends[:, 0:3] / ends[:, 3:4]
+
+        direction = far - near
+        return near, direction / np.linalg.norm(direction)
+
+    def reset_cull_counts(self) -> tuple[int, int]:
+        """ Return the visible and culled instances so far and start again. """
+
+        counts = (self.visible_count, self.culled_count)
+        self.visible_count = 0
+        self.culled_count = 0
+        return counts
 
-        
-        
-        self.render_objects(renderables)
-        
-        glFlush()
-        
     def destroy(self):
 
-        glDeleteProgram(self.shaders[PIPELINE_3D])
+        self.loader.destroy()
+        for mesh in self.meshes.values():
+            mesh.destroy()
+        if self.placeholder is not None:
+            self.placeholder.destroy()
+        for material in self.materials.values():
+            material = material.texture if isinstance(material, SurfaceMaterial) else material
+            material.destroy()
+        self.material_library.destroy()
+        self.instanceStream.destroy()
+        self.cameraBlock.destroy()
+        self.lightClusters.destroy()
+        for shader in self.shaders.values():
+            glDeleteProgram(shader)
+            GL_STATE.forget(program = shader)
+
+class Mesh:
+    """ A general mesh """
+
+
+    def __init__(self):
+
+        self.vertex_count = 0
+        self.index_count = 0
+        #false while the geometry is still being loaded
+        self.ready = True
+        #ranges drawn with different materials, from the mtl files
+        self.submeshes: list[Submesh] = []
+        self.libraries: list[str] = []
+        #the submeshes of each level of detail, the first is the full mesh
+        self.lods: list[list[Submesh]] = [self.submeshes]
+        #None for meshes which are never culled
+        self.bounds: Bounds | None = None
+        #bytes of graphics memory the vertex and index buffers take up
+        self.gpu_bytes = 0
+        #false once evicted, until it's loaded again
+        self.resident = True
+
+        self.vao = glGenVertexArrays(1)
+        self.vbo = glGenBuffers(1)
+        self.ebo = glGenBuffers(1)
+
+    def load(self) -> None:
+        """ (Re)load the geometry into the buffers. """
+
+        raise NotImplementedError
+
+    def evict(self) -> None:
+        """
+            Free the buffers' graphics memory. The mesh is kept,
+            and restore loads the geometry again from its cache.
+        """
+
+        GL_STATE.bind_vertex_array(self.vao)
+        for target, buffer in ((GL_ARRAY_BUFFER, self.vbo), (GL_ELEMENT_ARRAY_BUFFER, self.ebo)):
+            glBindBuffer(target, buffer)
+            glBufferData(target, 0, None, GL_STATIC_DRAW)
+        self.gpu_bytes = 0
+        self.ready = False
+        self.resident = False
 
-class PyramidMesh():
+    def restore(self) -> None:
+        """ Load the geometry of an evicted mesh again. """
+
+        self.resident = True
+        self.load()
+    
+    def destroy(self):
+        
+        glDeleteVertexArrays(1, (self.vao,))
+        GL_STATE.forget(vao = self.vao)
+        glDeleteBuffers(2,(self.vbo, self.ebo))
+
+class PyramidMesh(Mesh):
     def __init__(self):
         '''How to push triangle data to shader
         1. Set up mesh of triangle (e.g. literal vertice points)
@@ -925,10 +4427,17 @@ class PyramidMesh():
         
         '''
 
+        super().__init__()
         self.setup_triangles()
+        self.load()
+
+    def load(self) -> None:
+
         self.create_vertex_buffer_and_push()
         self.explain_to_shader_how_to_read_buffer()
-    
+        self.gpu_bytes = self.vertices.nbytes + self.indices.nbytes
+        self.ready = True
+
    
     
     def setup_triangles(self):
@@ -984,62 +4493,38 @@ class PyramidMesh():
             -1, -1, -1, 0.5, 0,  0, -1, 0,
             
         )
-        # convert the vertices into a numpy array
-        self.vertices = np.array(self.vertices, dtype=np.float32)
-        
-        self.vertex_count = len(self.vertices) // 5
+        # convert the vertices into a numpy array, sharing the repeated ones
+        self.vertices, self.indices = build_indexed_mesh(
+            np.array(self.vertices, dtype=np.float32).reshape(-1, 8)
+        )
         
-        #calculate the surface normals, using algebra
-        self.calculate_surface_normal()
+        self.vertex_count = len(self.vertices)
+        self.index_count = len(self.indices)
+        self.ready = True
+        #all drawn with the object type's own material
+        self.submeshes = [Submesh(0, self.index_count)]
+        self.lods = [self.submeshes]
+        self.libraries = []
+        self.bounds = Bounds(self.vertices[:, 0:3])
         
 
     def create_vertex_buffer_and_push(self):
         '''Create VAO and VBO
         Push our vertex object to the bush
         '''
-        # vertex array object (VAO) created
-        self.vao = glGenVertexArrays(1)
-        # make it active
-        glBindVertexArray(self.vao)
+        # vertex array object (VAO) was created by Mesh, make it active
+        GL_STATE.bind_vertex_array(self.vao)
         
-        self.vbo = glGenBuffers(1) # this is a vertex buffer which stores data
+        # this is a vertex buffer which stores data
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo) # make it active 
         upload_ready = True
         if upload_ready:
             # actually push data to array buffer
             glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
 
-    def calculate_surface_normal(self):
-        #front, right, left, back, bot right, bot left
-        v1 = [-1, -1, 1]
-        v2 = [1, -1, 1]
-        v3 = [0, 1, 0]
-        v4 = [-1, -1, -1]
-        v5 = [1, -1, -1]
-        pyramidTriangles = [
-            [v1,v2,v3],#front CORRECT
-            [v2, v5, v3],#right CORRECT
-            [v1, v3, v4],#left CORRECT
-            [v4, v3, v5],#back CORRECT
-            [v2,v1,v5],#botright CORRECT
-            [v5,v1,v4]#bot left CORRECT
-        ]
-        faces = [
-            "front","right","left","back","bottom right","bottom left"
-        ]
-        index = 0
-        # loop through every triangle that is in the pyramid
-        for triangle in pyramidTriangles:
-            #find the edge vectors
-            A = np.subtract(triangle[1],triangle[0])
-            B = np.subtract(triangle[2],triangle[0])
-            #calculate the surface normal
-            Nx = A[1] * B[2] - A[2] * B[1]
-            Ny = A[2] * B[0] - A[0] * B[2]
-            Nz = A[0] * B[1] - A[1] * B[0]
-            print(faces[index])
-            print(normalize([[Nx, Ny, Nz]]))#don't forget to normalize!
-            index += 1
+        # element buffer, which triangles use which vertices
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.indices.nbytes, self.indices, GL_STATIC_DRAW)
 
     def explain_to_shader_how_to_read_buffer(self):
         '''This function uses
@@ -1091,40 +4576,121 @@ class Material:
         self.texture = glGenTextures(1)
         self.textureType = textureType
         self.textureUnit = textureUnit
-        glBindTexture(textureType, self.texture)
+        #false while a placeholder stands in for the real image
+        self.ready = True
+        #bytes of graphics memory the texture takes up, mip levels and all
+        self.gpu_bytes = 0
+        #false once evicted, until it's loaded again
+        self.resident = True
+        GL_STATE.bind_texture(textureType, self.texture)
     
     def use(self):
-        glActiveTexture(GL_TEXTURE0 + self.textureUnit)
-        glBindTexture(self.textureType, self.texture)
+        GL_STATE.bind_texture(self.textureType, self.texture, self.textureUnit)
+
+    def load(self) -> None:
+        """ Set up the bound texture and (re)load its image. """
+
+        raise NotImplementedError
+
+    def evict(self) -> None:
+        """
+            Free the texture's graphics memory. The material is kept,
+            and restore loads the image again from its cache.
+        """
+
+        #a fresh texture, deleting the old one frees every mip level
+        self.destroy()
+        self.texture = glGenTextures(1)
+        self.gpu_bytes = 0
+        self.ready = False
+        self.resident = False
+
+    def restore(self) -> None:
+        """ Load the image of an evicted texture again. """
+
+        self.resident = True
+        GL_STATE.bind_texture(self.textureType, self.texture)
+        self.load()
     
     def destroy(self):
         glDeleteTextures(1, (self.texture,))
+        GL_STATE.forget(texture = self.texture)
 
 class Material2D(Material):
 
     
-    def __init__(self, filepath):
+    def __init__(self, filepath, loader: AssetLoader | None = None):
+        """
+            Make a texture from the given image file, or a plain
+            white one if filepath is None. If a loader is given,
+            the image is decoded in the background and a flat
+            placeholder colour is shown until it's ready.
+        """
         
         super().__init__(GL_TEXTURE_2D, 1)
+
+        self.filepath = filepath
+        self.loader = loader
+        self.load()
+
+    def load(self) -> None:
         
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST_MIPMAP_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        with Image.open(filepath, mode = "r") as image:
-            image_width,image_height = image.size
-            image = image.convert("RGBA")
-            img_data = bytes(image.tobytes())
-            glTexImage2D(GL_TEXTURE_2D,0,GL_RGBA,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-        glGenerateMipmap(GL_TEXTURE_2D)
+
+        if self.filepath is None:
+            self.upload([np.full((1, 1, 4), 255, dtype=np.uint8)])
+        elif self.loader is None:
+            self.upload(load_cached_texture(self.filepath))
+        else:
+            self.upload([np.array([[PLACEHOLDER_COLOR]], dtype=np.uint8)])
+            self.ready = False
+            self.loader.load(load_cached_texture, self.filepath, upload = self.upload)
+
+    def upload(self, levels: list[np.ndarray]) -> None:
+        """
+            Send the given (h, w, 4) RGBA pixels to the texture, one
+            array per mip level. The arrays (often memory mapped) are
+            passed straight to OpenGL without copying. Given only
+            the first level, the rest are generated.
+        """
+
+        GL_STATE.bind_texture(GL_TEXTURE_2D, self.texture)
+        for level, img_data in enumerate(levels):
+            image_height, image_width = img_data.shape[:2]
+            glTexImage2D(GL_TEXTURE_2D,level,GL_RGBA,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+        image_height, image_width = levels[0].shape[:2]
+        if len(levels) == 1:
+            #1000 is OpenGL's default, ie. as many levels as there are
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, 1000)
+            glGenerateMipmap(GL_TEXTURE_2D)
+            self.gpu_bytes = texture_bytes(image_width, image_height, None)
+        else:
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(levels) - 1)
+            self.gpu_bytes = texture_bytes(image_width, image_height, len(levels))
+        self.ready = True
 
 class MaterialCubemap(Material):
 
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, loader: AssetLoader | None = None):
+        """
+            Make a cubemap from the six images starting with filepath,
+            see load_cubemap_images. If a loader is given, they are
+            decoded in the background and a flat placeholder colour is
+            shown until they're ready.
+        """
 
         super().__init__(GL_TEXTURE_CUBE_MAP, 0)
 
+        self.filepath = filepath
+        self.loader = loader
+        self.load()
+
+    def load(self) -> None:
+
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_WRAP_R, GL_CLAMP_TO_EDGE)
@@ -1132,63 +4698,204 @@ class MaterialCubemap(Material):
         glTexParameteri(GL_TEXTURE_CUBE_MAP, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
 
         #load textures
-        with Image.open(f"{filepath}_left.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_Y,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-        
-        with Image.open(f"{filepath}_right.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = ImageOps.flip(img)
-            img = ImageOps.mirror(img)
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_Y,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-        
-        with Image.open(f"{filepath}_top.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = img.rotate(90)
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_Z,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-
-        with Image.open(f"{filepath}_bottom.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = img.rotate(90)
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_Z,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-        
-        with Image.open(f"{filepath}_back.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = img.rotate(-90)
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_NEGATIVE_X,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
-
-        with Image.open(f"{filepath}_front.png", mode = "r") as img:
-            image_width,image_height = img.size
-            img = img.rotate(90)
-            img = img.convert('RGBA')
-            img_data = bytes(img.tobytes())
-            glTexImage2D(GL_TEXTURE_CUBE_MAP_POSITIVE_X,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+        if self.loader is None:
+            self.upload(load_cached_cubemap(self.filepath))
+        else:
+            placeholder = np.array([[PLACEHOLDER_COLOR]], dtype=np.uint8)
+            self.upload([
+                (GL_TEXTURE_CUBE_MAP_POSITIVE_X + face, placeholder)
+                for face in range(6)
+            ])
+            self.ready = False
+            self.loader.load(load_cached_cubemap, self.filepath, upload = self.upload)
+
+    def upload(self, faces: list[tuple[int, np.ndarray]]) -> None:
+        """
+            Send the given (face target, RGBA pixels) pairs to the
+            cubemap, straight from the arrays without copying.
+        """
 
-class Mesh:
-    """ A general mesh """
+        GL_STATE.bind_texture(GL_TEXTURE_CUBE_MAP, self.texture)
+        self.gpu_bytes = 0
+        for target, img_data in faces:
+            image_height, image_width = img_data.shape[:2]
+            glTexImage2D(target,0,GL_RGBA8,image_width,image_height,0,GL_RGBA,GL_UNSIGNED_BYTE,img_data)
+            self.gpu_bytes += texture_bytes(image_width, image_height)
+        self.ready = True
+
+class SurfaceMaterial:
+    """
+        How a surface reflects light: a diffuse texture tinted by
+        a diffuse colour, and a specular colour and exponent.
+        The defaults leave the texture as it is, with white highlights.
+    """
+
+
+    def __init__(self, texture: Material2D,
+        diffuse: tuple[float] = (1.0, 1.0, 1.0),
+        specular: tuple[float] = (1.0, 1.0, 1.0),
+        shininess: float = 32.0):
+
+        self.texture = texture
+        self.diffuse = np.array(diffuse, dtype=np.float32)
+        self.specular = np.array(specular, dtype=np.float32)
+        #pow(0, 0) is undefined in glsl
+        self.shininess = max(shininess, 1.0)
+
+    def use(self, locations: dict[str, int]) -> None:
+        """
+            Bind the texture and set the material uniforms,
+            given their locations in the current shader.
+        """
+
+        self.texture.use()
+        glUniform3fv(locations["diffuse"], 1, self.diffuse)
+        glUniform3fv(locations["specular"], 1, self.specular)
+        glUniform1f(locations["shininess"], self.shininess)
+
+class MaterialLibrary:
+    """
+        Every material read from mtl files, each one made only once
+        however many meshes use it, and each texture loaded only once
+        however many materials use it.
+    """
+
+
+    def __init__(self, loader: AssetLoader | None = None):
+
+        self.loader = loader
+        #parsed mtl files, by path
+        self.definitions: dict[str, dict[str, dict[str, Any]]] = {}
+        self.materials: dict[tuple[str, str], SurfaceMaterial] = {}
+        self.textures: dict[str | None, Material2D] = {}
+
+    def get(self, libraries: list[str], name: str | None) -> SurfaceMaterial | None:
+        """
+            Return the material of the given name from the first of the
+            given mtl files which declares it, or None if none of them do.
+        """
+
+        if name is None:
+            return None
+
+        for library in libraries:
+            material = self.materials.get((library, name))
+            if material is not None:
+                return material
+
+            if library not in self.definitions:
+                try:
+                    self.definitions[library] = load_material_library(library)
+                except OSError:
+                    #named by the obj but missing, use the defaults
+                    self.definitions[library] = {}
+            definition = self.definitions[library].get(name)
+            if definition is None:
+                continue
+
+            texture_path = definition["map_Kd"]
+            if texture_path not in self.textures:
+                self.textures[texture_path] = Material2D(texture_path, self.loader)
+            material = SurfaceMaterial(
+                self.textures[texture_path], definition["Kd"],
+                definition["Ks"], definition["Ns"]
+            )
+            self.materials[(library, name)] = material
+            return material
+
+        return None
+
+    def destroy(self) -> None:
+
+        for texture in self.textures.values():
+            texture.destroy()
+
+class InstanceBuffer:
+    """
+        The model transforms and tints of the entities drawn with a
+        mesh, written each frame into a StreamBuffer, a transform then
+        a tint per instance. Meshes read a row per instance (an attribute
+        divisor of 1), so all of them are drawn with a single instanced
+        draw call.
+    """
 
 
     def __init__(self):
 
-        self.vertex_count = 0
+        self.count = 0
+        #where this frame's rows are
+        self.buffer = 0
+        self.offset = 0
 
-        self.vao = glGenVertexArrays(1)
-        self.vbo = glGenBuffers(1)
-    
-    def destroy(self):
-        
-        glDeleteVertexArrays(1, (self.vao,))
-        glDeleteBuffers(1,(self.vbo,))
+    def write(self, stream: StreamBuffer,
+        transforms: np.ndarray, tints: np.ndarray) -> None:
+        """
+            Write the given (n, 4, 4) transforms and (n, 4) tints,
+            eg. those of a TransformStore, into the stream's buffer.
+        """
+
+        self.count = len(transforms)
+        self.buffer = stream.buffer
+        self.offset, data = stream.reserve(self.count * INSTANCE_FLOATS * 4)
+        rows = data.view(np.float32).reshape(self.count, INSTANCE_FLOATS)
+        rows[:, 0:16] = transforms.reshape(-1, 16)
+        rows[:, 16:20] = tints
+
+    def attach(self, mesh: Mesh) -> None:
+        """ Point the mesh's instance attributes at this frame's rows. """
+
+        stride = INSTANCE_FLOATS * 4
+        GL_STATE.bind_vertex_array(mesh.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+        #model matrix, a column per location
+        for column in range(4):
+            glEnableVertexAttribArray(3 + column)
+            glVertexAttribPointer(3 + column, 4, GL_FLOAT, GL_FALSE, stride,
+                ctypes.c_void_p(self.offset + 16 * column))
+            glVertexAttribDivisor(3 + column, 1)
+        #tint
+        glEnableVertexAttribArray(7)
+        glVertexAttribPointer(7, 4, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(self.offset + 64))
+        glVertexAttribDivisor(7, 1)
+
+class Submesh:
+    """
+        A range of a mesh's triangles drawn with one material.
+        first and count are in indices for indexed meshes, otherwise
+        in vertices, and material is the name of its mtl material,
+        None meaning the default material of the object type.
+        level is the level of detail it belongs to, 0 being the full mesh.
+    """
+
+
+    def __init__(self, first: int, count: int,
+        material: str | None = None, level: int = 0):
+
+        self.first = first
+        self.count = count
+        self.material = material
+        self.level = level
+
+class Bounds:
+    """
+        The bounding box and sphere of a mesh, in model space.
+        The sphere is centered on the box, just big enough for
+        every vertex.
+    """
+
+
+    def __init__(self, positions: np.ndarray):
+
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        if len(positions) == 0:
+            positions = np.zeros((1, 3), dtype=np.float32)
+
+        self.lower = positions.min(axis = 0)
+        self.upper = positions.max(axis = 0)
+        self.box_center = (self.lower + self.upper) / 2
+        self.half_size = (self.upper - self.lower) / 2
+        self.center = self.box_center
+        self.radius = float(np.sqrt(((positions - self.center) ** 2).sum(axis = 1).max()))
 
 class Quad2D(Mesh):
 
@@ -1210,30 +4917,94 @@ class Quad2D(Mesh):
             x + w, y - h,
         )
         self.vertex_count = 6
-        vertices = np.array(vertices, dtype=np.float32)
+        self.submeshes = [Submesh(0, self.vertex_count)]
+        self.lods = [self.submeshes]
+        self.vertices = np.array(vertices, dtype=np.float32)
+        self.load()
+
+    def load(self) -> None:
 
-        glBindVertexArray(self.vao)
+        GL_STATE.bind_vertex_array(self.vao)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        glBufferData(GL_ARRAY_BUFFER, self.vertices.nbytes, self.vertices, GL_STATIC_DRAW)
         #position
         glEnableVertexAttribArray(0)
         glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 8, ctypes.c_void_p(0))
+        self.gpu_bytes = self.vertices.nbytes
+        self.ready = True
 
 class ObjMesh(Mesh):
+    """
+        A mesh loaded from an obj file.
+
+        By default the geometry is indexed, optimized and cached next
+        to the file. With streaming set, the file is instead read in
+        chunks into one growing buffer and uploaded in pieces, which
+        keeps memory use close to the size of the final vertex buffer;
+        such meshes have no index buffer (index_count is 0) and are
+        drawn with glDrawArrays.
+
+        Faces are split into a Submesh per usemtl material, their
+        materials are looked up in the mtl files listed in libraries.
+        Indexed meshes also come with simplified levels of detail,
+        whose submeshes are in lods.
+
+        If a loader is given, the file is read in the background and
+        the mesh isn't ready until its upload has run.
+    """
 
 
-    def __init__(self, filename):
+    def __init__(self, filename, streaming = False,
+        loader: AssetLoader | None = None):
 
         super().__init__()
 
+        self.filename = filename
+        self.streaming = streaming
+        self.loader = loader
+        self.load()
+
+    def load(self) -> None:
+
+        read = read_streamed_model if self.streaming else load_cached_model
+        if self.loader is None:
+            self.upload(read(self.filename))
+        else:
+            self.ready = False
+            self.loader.load(read, self.filename, upload = self.upload)
+
+    def upload(self, geometry: tuple[
+        np.ndarray, np.ndarray | None, list[Submesh], list[str]]) -> None:
+        """
+            Send the given (n, 8) vertices, and indices if there are any,
+            to the graphics card, and take on the given submeshes
+            and mtl files, see load_cached_model. Submeshes of the
+            simplified levels of detail are sorted into lods.
+        """
+
         # x, y, z, s, t, nx, ny, nz
-        vertices = load_model_from_file(filename)
-        self.vertex_count = len(vertices)//8
-        vertices = np.array(vertices, dtype=np.float32)
+        vertices, indices, submeshes, self.libraries = geometry
+        self.lods = [
+            [submesh for submesh in submeshes if submesh.level == level]
+            for level in range(max((submesh.level for submesh in submeshes), default = 0) + 1)
+        ]
+        self.submeshes = self.lods[0]
 
-        glBindVertexArray(self.vao)
+        GL_STATE.bind_vertex_array(self.vao)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        self.vertex_count = len(vertices)
+        self.bounds = Bounds(vertices[:, 0:3])
+
+        if indices is None:
+            upload_in_pieces(GL_ARRAY_BUFFER, vertices)
+            self.gpu_bytes = vertices.nbytes
+        else:
+            self.index_count = len(indices)
+            glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+            self.gpu_bytes = vertices.nbytes + indices.nbytes
+
         #position
         glEnableVertexAttribArray(0)
         glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(0))
@@ -1243,6 +5014,302 @@ class ObjMesh(Mesh):
         #normal
         glEnableVertexAttribArray(2)
         glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 32, ctypes.c_void_p(20))
+        self.ready = True
+
+class AssetLoader:
+    """
+        Reads and decodes assets on a pool of worker threads.
+
+        Finished results wait in a queue until the render loop calls
+        process_uploads, which hands them to their upload functions on
+        the main thread (the only one with the OpenGL context), a few
+        per frame so loading never holds up drawing for long.
+    """
+
+
+    def __init__(self, workers: int = ASSET_LOADER_WORKERS):
+
+        self.pool = ThreadPoolExecutor(
+            max_workers = workers, thread_name_prefix = "asset"
+        )
+        self.finished: queue.SimpleQueue[tuple[Callable[[Any], None], Future]] = queue.SimpleQueue()
+        self.pending = 0
+
+    def load(self, read: Callable[..., Any], *args,
+        upload: Callable[[Any], None]) -> None:
+        """
+            Run read(*args) in the background, then upload(result)
+            on the main thread during a later process_uploads.
+        """
+
+        self.pending += 1
+        future = self.pool.submit(read, *args)
+        future.add_done_callback(lambda done: self.finished.put((upload, done)))
+
+    def process_uploads(self, budget: float = ASSET_UPLOAD_BUDGET) -> int:
+        """
+            Upload finished assets until the queue is empty or budget
+            seconds have passed, returning how many were uploaded.
+            At least one is uploaded if any are waiting.
+        """
+
+        deadline = time.perf_counter() + budget
+        uploaded = 0
+        while uploaded == 0 or time.perf_counter() < deadline:
+            try:
+                upload, future = self.finished.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            #raises here, on the main thread, if the read failed
+            upload(future.result())
+            uploaded += 1
+
+        return uploaded
+
+    def finish(self) -> None:
+        """ Wait for, and upload, everything still loading. """
+
+        while self.pending:
+            upload, future = self.finished.get()
+            self.pending -= 1
+            upload(future.result())
+
+    def destroy(self) -> None:
+
+        self.pool.shutdown(wait = False, cancel_futures = True)
+
+class AssetTable:
+    """
+        Assets by key, each made the first time it's asked for,
+        so starting up only pays for what the opening scene uses.
+    """
+
+
+    def __init__(self, factories: dict[Any, Callable[[], Any]]):
+
+        self.factories = factories
+        self.assets: dict[Any, Any] = {}
+
+    def get(self, key, default = None):
+        """ The asset for key, made now if it hasn't been yet. """
+
+        if key not in self.assets:
+            if key not in self.factories:
+                return default
+            self.assets[key] = self.factories[key]()
+        return self.assets[key]
+
+    def __getitem__(self, key):
 
+        asset = self.get(key, self)
+        if asset is self:
+            raise KeyError(key)
+        return asset
 
-myApp = App(800,600)
\ No newline at end of file
+    def __setitem__(self, key, asset) -> None:
+
+        self.assets[key] = asset
+
+    def __contains__(self, key) -> bool:
+
+        return key in self.assets or key in self.factories
+
+    def items(self) -> Iterator[tuple[Any, Any]]:
+        """ The assets made so far, with their keys. """
+
+        return iter(self.assets.items())
+
+    def values(self) -> Iterator[Any]:
+        """ The assets made so far. """
+
+        return iter(self.assets.values())
+
+class GPUMemoryBudget:
+    """
+        Keeps the graphics memory taken by meshes and textures under a
+        budget, by evicting those drawn least recently.
+
+        Assets are counted as they're drawn (see use), each one a Mesh
+        or Material, which know their own gpu_bytes and can evict and
+        restore themselves. Every asset is reference counted by the
+        scene entities using it: an owner (an object type) lists the
+        assets it uses with reference, and count says how many
+        entities it has. Assets nothing references go first, then
+        the rest, least recently drawn first, but never one drawn in
+        the current frame. An evicted asset is loaded again, from its
+        cache, the next time it's drawn.
+    """
+
+
+    def __init__(self, budget: int = GPU_MEMORY_BUDGET):
+
+        self.budget = budget
+        #least recently drawn first
+        self.last_drawn: OrderedDict[Mesh | Material, int] = OrderedDict()
+        self.references: dict[Mesh | Material, int] = {}
+        #assets used by each owner, and how many entities each has
+        self.owned: dict[Any, set[Mesh | Material]] = {}
+        self.entities: dict[Any, int] = {}
+        self.frame = 0
+        self.evictions = 0
+        self.restores = 0
+
+    def use(self, asset: Mesh | Material) -> None:
+        """ Note that the asset is drawn this frame, restoring it if it was evicted. """
+
+        if not asset.resident:
+            asset.restore()
+            self.restores += 1
+        self.last_drawn[asset] = self.frame
+        self.last_drawn.move_to_end(asset)
+
+    def reference(self, owner, asset: Mesh | Material) -> None:
+        """ Note that the entities of owner use the asset. """
+
+        if asset not in self.last_drawn:
+            #counted from now on, first in line until it's drawn
+            self.last_drawn[asset] = -1
+            self.last_drawn.move_to_end(asset, last = False)
+        assets = self.owned.setdefault(owner, set())
+        if asset not in assets:
+            assets.add(asset)
+            self.references[asset] = self.references.get(asset, 0) + self.entities.get(owner, 0)
+
+    def count(self, entities: dict[Any, int]) -> None:
+        """
+            Set how many entities each owner has, those left out have
+            none, adding to or taking from the references of their assets.
+        """
+
+        for owner in self.entities.keys() | entities.keys():
+            change = entities.get(owner, 0) - self.entities.get(owner, 0)
+            if change == 0:
+                continue
+            self.entities[owner] = entities.get(owner, 0)
+            for asset in self.owned.get(owner, ()):
+                self.references[asset] = self.references.get(asset, 0) + change
+
+    def used(self) -> int:
+        """ Bytes of graphics memory the assets take up now. """
+
+        return sum(asset.gpu_bytes for asset in self.last_drawn)
+
+    def end_frame(self) -> None:
+        """ Evict assets until they fit in the budget, then start the next frame. """
+
+        used = self.used()
+        for referenced in (False, True):
+            for asset, frame in list(self.last_drawn.items()):
+                if used <= self.budget or frame == self.frame:
+                    break
+                #still loading, or already gone
+                if not asset.ready or not asset.resident \
+                    or (self.references.get(asset, 0) > 0) != referenced:
+                    continue
+                used -= asset.gpu_bytes
+                asset.evict()
+                self.evictions += 1
+        self.frame += 1
+
+    def report(self) -> None:
+        """ Print the memory used against the budget, and the evictions and restores. """
+
+        print(f"gpu memory: {self.used() / 2**20:.1f} of {self.budget / 2**20:.0f} MB, "
+              f"{self.evictions} evicted, {self.restores} restored")
+
+
+def parse_arguments() -> argparse.Namespace:
+    """ Read the command line options. """
+
+    parser = argparse.ArgumentParser(description = "Yaka Arrow")
+    parser.add_argument(
+        "--mesh-report", action = "store_true",
+        help = "print vertex reuse and cache statistics for every model, then exit"
+    )
+    parser.add_argument(
+        "--texture-report", action = "store_true",
+        help = "print cold and warm load times of the sky cubemap, then exit"
+    )
+    parser.add_argument(
+        "--shader-report", action = "store_true",
+        help = "print how long the shader programs take to make with and without their cache, then exit"
+    )
+    parser.add_argument(
+        "--headless", action = "store_true",
+        help = "render offscreen, without a window or input, and print frame timings"
+    )
+    parser.add_argument(
+        "--osmesa", action = "store_true",
+        help = "with --headless, make the context with OSMesa rather than EGL"
+    )
+    parser.add_argument(
+        "--size", default = "800x600",
+        help = "with --headless, the framebuffer size as WIDTHxHEIGHT"
+    )
+    parser.add_argument(
+        "--frames", type = int, default = 100,
+        help = "with --headless, how many frames to render"
+    )
+    parser.add_argument(
+        "--script",
+        help = "with --headless, a python file whose step(app, frame) drives each frame"
+    )
+    parser.add_argument(
+        "--output",
+        help = "with --headless, save the last frame to this image file"
+    )
+    parser.add_argument(
+        "--max-fps", type = float, default = 0,
+        help = "cap the frame rate, sleeping between frames (0 draws as fast as possible)"
+    )
+    parser.add_argument(
+        "--record",
+        help = "on quitting, save every tick's keyboard and mouse input to this file"
+    )
+    parser.add_argument(
+        "--replay",
+        help = "play back input saved with --record instead of using the keyboard and mouse"
+               " (with --headless, a tick per frame, for as many frames as were recorded)"
+    )
+    parser.add_argument(
+        "--trace",
+        help = "on quitting, write the frame timings to this Chrome trace (JSON) file"
+    )
+    parser.add_argument(
+        "--gpu-budget", type = float, default = GPU_MEMORY_BUDGET / 2**20,
+        help = "graphics memory (MB) meshes and textures may use before the least recently drawn are evicted"
+    )
+    return parser.parse_args()
+
+STARTUP.mark("imports")
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    if arguments.mesh_report:
+        report_mesh_statistics(MODEL_FOLDER)
+    elif arguments.texture_report:
+        report_texture_load_times(SKY_TEXTURE)
+    elif arguments.shader_report:
+        #a context is all it needs, so it's made offscreen
+        context = OffscreenContext(64, 64)
+        report_shader_load_times()
+        context.destroy()
+    elif arguments.headless:
+        width, height = (int(size) for size in arguments.size.lower().split("x"))
+        frames = arguments.frames
+        script = demo_script
+        if arguments.script:
+            script = runpy.run_path(arguments.script)["step"]
+        elif arguments.replay:
+            ticks = load_input_recording(arguments.replay)
+            script = replay_script(ticks)
+            frames = len(ticks)
+        HeadlessApp(width, height, frames, script, arguments.output, arguments.trace,
+            gpu_budget = int(arguments.gpu_budget * 2**20))
+    else:
+        myApp = App(
+            800,600, trace = arguments.trace, max_fps = arguments.max_fps,
+            record = arguments.record, replay = arguments.replay,
+            gpu_budget = int(arguments.gpu_budget * 2**20)
+        )